@@ -0,0 +1,122 @@
+import json
+import logging
+import os
+
+
+FORMATS = ("json", "jsonl")
+
+
+def make_answers(texts, cands, scores=None, candidates=None):
+    """
+    Return the answers of the given texts as dictionaries in the format
+    of jsonhandler.storeJson.
+    """
+    answers = []
+    for i, text in enumerate(texts):
+        answer = {"unknown_text": text, "author": cands[i],
+                  "score": scores[i] if scores is not None else 1}
+        if candidates is not None:
+            answer["candidates"] = candidates[i]
+        answers.append(answer)
+    return answers
+
+
+class AnswerWriter:
+
+    """
+    Writes answers incrementally, such that they do not have to be kept
+    in memory, and keeps a checkpoint of the answers which are completely
+    written, such that an interrupted run can be resumed.
+
+    There are two formats:
+    json -- A streamed JSON object {"answers": [...]} which is identical
+            to the output of jsonhandler.storeJson. It is only valid JSON
+            once the writer is closed.
+    jsonl -- JSON Lines, i.e. one answer per line.
+
+    The checkpoint is a small JSON file next to the output (path +
+    ".checkpoint") which contains the number of written answers and the
+    size of the output after them. It is replaced atomically after every
+    write and removed when the writer is closed. If a writer is created
+    for an output with a checkpoint, the output is truncated to the size
+    in the checkpoint (dropping a partially written chunk) and done is the
+    number of answers which can be skipped.
+    """
+
+    def __init__(self, path, format="json", resume=True):
+        """
+        Open the output for writing.
+
+        Keyword arguments:
+        path -- Path to the output file.
+        format -- "json" or "jsonl" (default "json")
+        resume -- Resume from the checkpoint of the output, if there is
+                  one. Otherwise the output is written from scratch.
+                  (default True)
+        """
+        if format not in FORMATS:
+            raise ValueError("Unknown answer format '%s'." % format)
+        self.path = path
+        self.format = format
+        self.checkpoint_path = path + ".checkpoint"
+        self.done = 0
+
+        checkpoint = None
+        if resume and os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path, "r") as f:
+                checkpoint = json.load(f)
+            if checkpoint["format"] != format:
+                raise ValueError("'%s' has been written as %s, not as %s."
+                                 % (path, checkpoint["format"], format))
+        if checkpoint is not None:
+            self.done = checkpoint["done"]
+            os.truncate(path, checkpoint["size"])
+            self.file = open(path, "ab")
+            logging.info("Answers: Resuming '%s' after %s answers.", path,
+                         self.done)
+        else:
+            self.file = open(path, "wb")
+            if format == "json":
+                self.file.write(b'{\n  "answers": [')
+            self.checkpoint()
+
+    def write(self, answers):
+        """
+        Append the given answers (see make_answers) to the output and
+        update the checkpoint once they are on disk.
+        """
+        if not answers:
+            return
+        if self.format == "json":
+            data = ",".join("\n    " + json.dumps(answer, indent=2)
+                            .replace("\n", "\n    ") for answer in answers)
+            if self.done > 0:
+                data = "," + data
+        else:
+            data = "".join(json.dumps(answer) + "\n" for answer in answers)
+        self.file.write(data.encode("utf-8"))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.done += len(answers)
+        self.checkpoint()
+
+    def checkpoint(self):
+        temporary = self.checkpoint_path + ".tmp"
+        with open(temporary, "w") as f:
+            json.dump({"format": self.format, "done": self.done,
+                       "size": self.file.tell()}, f)
+        os.replace(temporary, self.checkpoint_path)
+
+    def close(self):
+        """Complete the output and remove the checkpoint."""
+        if self.format == "json":
+            if self.done == 0:
+                self.file.seek(0)
+                self.file.truncate()
+                self.file.write(b'{\n  "answers": []\n}')
+            else:
+                self.file.write(b"\n  ]\n}")
+        self.file.close()
+        os.remove(self.checkpoint_path)
+        logging.info("Answers: Written %s answers to '%s'.", self.done,
+                     self.path)
@@ -0,0 +1,241 @@
+import argparse
+import heapq
+import json
+import logging
+import time
+
+import numpy as np
+
+from burrows02 import delta_matrix, rank_candidates
+
+
+class Node:
+
+    """A node of an AuthorIndex, i.e. a bounding box of some authors."""
+
+    __slots__ = ("lower", "upper", "rows", "children")
+
+    def __init__(self, lower, upper, rows=None, children=()):
+        self.lower = lower          # the minimal zscore of every word
+        self.upper = upper          # the maximal zscore of every word
+        self.rows = rows            # the authors of a leaf
+        self.children = children    # the child nodes of an inner node
+
+
+class AuthorIndex:
+
+    """
+    An index of the zscore vectors of authors which returns the exact k
+    closest authors of a text under Delta, i.e. the same authors as
+    delta_matrix and rank_candidates, without scanning every author.
+
+    Delta only considers the words of the query text (see
+    Text.calc_delta), so it is no metric over the author vectors and
+    metric trees can not prune with it. Instead, the authors are split
+    recursively into a tree of axis-aligned bounding boxes: the Delta of a
+    query and every author in a box is at least the sum of the distances
+    of the query's zscores to the box along the words of the query.
+    The query visits the boxes in the order of this lower bound and stops
+    as soon as it exceeds the delta of the k-th closest author found.
+    """
+
+    def __init__(self, zscores, leaf_size=32):
+        """
+        Initialize an index.
+
+        Keyword arguments:
+        zscores -- The zscore matrix of the authors (one row per author).
+        leaf_size -- Maximal number of authors of a leaf. (default 32)
+        """
+        self.zscores = np.asarray(zscores, dtype=float)
+        self.leaf_size = leaf_size
+        self.evaluations = 0  # number of authors whose delta was calculated
+        self.root = self.build(np.arange(len(self.zscores)))
+
+    def build(self, rows):
+        """Build the tree of the authors with the given rows."""
+        vectors = self.zscores[rows]
+        if len(rows) == 0:
+            width = self.zscores.shape[1]
+            return Node(np.zeros(width), np.zeros(width), rows)
+        lower = vectors.min(axis=0)
+        upper = vectors.max(axis=0)
+        if len(rows) <= self.leaf_size:
+            return Node(lower, upper, rows)
+        # Split at the median of the projection onto the direction between
+        # two distant authors, which separates groups of similar authors
+        # and thus yields tight boxes.
+        first = np.abs(vectors - vectors[0]).sum(axis=1).argmax()
+        second = np.abs(vectors - vectors[first]).sum(axis=1).argmax()
+        projection = vectors @ (vectors[second] - vectors[first])
+        order = np.argsort(projection, kind="stable")
+        half = len(rows) // 2
+        return Node(lower, upper, children=(self.build(rows[order[:half]]),
+                                            self.build(rows[order[half:]])))
+
+    def query(self, zscores, mask=None, k=1):
+        """
+        Return the rows of the k closest authors of a text and their
+        deltas, sorted like rank_candidates (ties by the order of the
+        authors).
+
+        Keyword arguments:
+        zscores -- The zscore vector of the text.
+        mask -- The boolean vector of the words of the text (see
+                zscore_matrix). If None then all words are considered.
+                (default None)
+        k -- Number of authors. (default 1)
+        """
+        if k <= 0:
+            return [], []
+        if mask is None:
+            mask = np.ones(len(zscores), dtype=bool)
+        words = np.flatnonzero(mask)
+        query = zscores[words]
+        weights = mask.astype(float)
+
+        # best holds the k closest authors as (-delta, -row), i.e. its
+        # first element is the farthest of them.
+        best = []
+        nodes = [(0.0, 0, self.root)]
+        pushed = 1
+        while nodes:
+            bound, _, node = heapq.heappop(nodes)
+            if len(best) == k and bound > bounded(-best[0][0]):
+                break
+            if node.rows is not None:
+                if len(node.rows) == 0:
+                    continue
+                self.evaluations += len(node.rows)
+                # the same arithmetic as delta_matrix
+                deltas = (np.abs(zscores - self.zscores[node.rows])
+                          * weights).sum(axis=1)
+                for row, delta in zip(node.rows.tolist(), deltas.tolist()):
+                    item = (-delta, -row)
+                    if len(best) < k:
+                        heapq.heappush(best, item)
+                    elif item > best[0]:
+                        heapq.heapreplace(best, item)
+                continue
+            for child in node.children:
+                distance = (np.maximum(child.lower[words] - query, 0) +
+                            np.maximum(query - child.upper[words], 0)).sum()
+                heapq.heappush(nodes, (distance, pushed, child))
+                pushed += 1
+
+        best.sort(reverse=True)
+        return ([-row for delta, row in best],
+                [-delta for delta, row in best])
+
+    def query_matrix(self, zscores, mask=None, k=1):
+        """
+        Query every row of a zscore matrix (see query). Returns a matrix
+        of the rows of the k closest authors of every text and a matrix
+        of their deltas.
+        """
+        rows, deltas = [], []
+        for i in range(len(zscores)):
+            text_rows, text_deltas = self.query(
+                zscores[i], None if mask is None else mask[i], k)
+            rows.append(text_rows)
+            deltas.append(text_deltas)
+        return np.array(rows, dtype=np.intp), np.array(deltas)
+
+
+def bounded(delta):
+    """
+    Return the largest lower bound which can not exclude a delta, i.e.
+    the delta plus a tolerance for rounding errors (the lower bounds are
+    summed differently than the deltas).
+    """
+    return delta * (1 + 1e-9) + 1e-9
+
+
+def synthetic(authors, words, texts, clusters=64, seed=0):
+    """
+    Return the zscores of synthetic authors (which are grouped in clusters
+    like authors of similar genres or periods) and of texts of randomly
+    chosen authors with their masks.
+    """
+    random = np.random.default_rng(seed)
+    centers = random.normal(0, 1, (clusters, words))
+    author_zscores = centers[random.integers(clusters, size=authors)] \
+        + random.normal(0, 0.3, (authors, words))
+    truth = random.integers(authors, size=texts)
+    text_zscores = author_zscores[truth] + random.normal(0, 0.3, (texts, words))
+    mask = random.random((texts, words)) < 0.8
+    return author_zscores, np.where(mask, text_zscores, 0), mask
+
+
+def benchmark(sizes, words=150, texts=100, k=10, leaf_size=32):
+    """
+    Compare the index with the brute-force scan for synthetic author sets
+    of the given sizes. Returns one result per size with the mean number
+    of deltas calculated per query and the time per query.
+    """
+    results = []
+    for authors in sizes:
+        author_zscores, text_zscores, mask = synthetic(authors, words, texts)
+        start = time.perf_counter()
+        deltas = delta_matrix(text_zscores, author_zscores, mask)
+        expected = rank_candidates(deltas, k)
+        brute_force = time.perf_counter() - start
+
+        start = time.perf_counter()
+        index = AuthorIndex(author_zscores, leaf_size=leaf_size)
+        build = time.perf_counter() - start
+        start = time.perf_counter()
+        rows, index_deltas = index.query_matrix(text_zscores, mask, k)
+        query = time.perf_counter() - start
+
+        results.append({
+            "authors": authors,
+            "evaluations": index.evaluations / texts,
+            "fraction": index.evaluations / texts / authors,
+            "brute_force_time": brute_force / texts,
+            "index_time": query / texts,
+            "build_time": build,
+            "exact": bool((rows == expected).all()),
+        })
+        logging.info("AuthorIndex: %s", results[-1])
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark of the author index against a brute-force '
+                    'scan on synthetic zscores.')
+    parser.add_argument('--authors',
+                        action='store',
+                        type=int,
+                        nargs='+',
+                        default=[1000, 4000, 16000, 64000],
+                        help='The numbers of authors')
+    parser.add_argument('--words',
+                        action='store',
+                        type=int,
+                        default=150,
+                        help='The number of considered words')
+    parser.add_argument('--texts',
+                        action='store',
+                        type=int,
+                        default=100,
+                        help='The number of queries per size')
+    parser.add_argument('-k',
+                        action='store',
+                        type=int,
+                        default=10,
+                        help='The number of closest authors')
+
+    args = vars(parser.parse_args())
+
+    results = benchmark(args['authors'], words=args['words'],
+                        texts=args['texts'], k=args['k'])
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    # execute only if run as a script
+    logging.basicConfig(level=logging.ERROR,
+                        format='%(asctime)s %(levelname)s: %(message)s')
+    main()
@@ -0,0 +1,159 @@
+import argparse
+import logging
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import instrumentation
+from burrows02 import add_tira_arguments, tira, tira_options
+from instrumentation import metrics
+from vocabulary import vocabulary
+
+
+def read_manifest(path):
+    """
+    Return the problems of a manifest as a list of (input, output) tuples.
+
+    Every line of a manifest contains the path to the input directory (or
+    packed corpus) and the path to the output directory of one problem,
+    separated by a tab (or, if there is no tab, by whitespace). Empty lines
+    and lines starting with # are ignored.
+    """
+    problems = []
+    with open(path, "r", encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            fields = line.split("\t") if "\t" in line else line.split()
+            if len(fields) != 2:
+                raise ValueError("%s:%d: Expected an input and an output path."
+                                 % (path, number))
+            problems.append((fields[0].strip(), fields[1].strip()))
+    return problems
+
+
+def run_problem(corpusdir, outputdir, options, report=False):
+    """
+    Solve one problem with tira and return the time it took, the error
+    (a formatted traceback or None) and, if report is True, the metrics of
+    the problem (see instrumentation.Metrics.report) or None.
+    """
+    # The words of the previous problems are not needed anymore, so the
+    # vocabulary of a long-lived worker does not grow with every problem.
+    vocabulary.clear()
+    if report:
+        metrics.reset()
+    start = time.perf_counter()
+    error = None
+    try:
+        os.makedirs(outputdir, exist_ok=True)
+        tira(corpusdir, outputdir, **options)
+    except Exception:
+        error = traceback.format_exc()
+    return (time.perf_counter() - start, error,
+            metrics.report() if report else None)
+
+
+def batch(problems, jobs=1, cache=None, **options):
+    """
+    Solve several problems in one process pool, such that the interpreter
+    startup and the imports are paid once per worker instead of once per
+    problem. Every answers.json is written by its worker as soon as the
+    problem is solved. A failing problem is logged and does not stop the
+    other ones. Returns a list of (input, output, time, error) tuples in
+    the order in which the problems were finished.
+
+    Keyword arguments:
+    problems -- A list of (input, output) tuples (see read_manifest).
+    jobs -- Number of worker processes. If 1 then the problems are solved
+            in this process. If 0 then one process per CPU is used.
+            (default 1)
+    cache -- A countcache.CountCache which is shared by all workers, such
+             that documents which occur in several problems are only
+             tokenized once. (default None)
+    The other keyword arguments are passed to tira. Every problem is
+    solved with jobs=1 in its worker.
+    """
+    options = dict(options, jobs=1, cache=cache)
+    results = []
+
+    def finish(corpusdir, outputdir, result):
+        seconds, error, report = result
+        if report is not None:
+            metrics.merge(report)
+        if error is None:
+            logging.info("Batch: Solved '%s' in %.3f s.", corpusdir, seconds)
+        else:
+            logging.error("Batch: Failed to solve '%s':\n%s", corpusdir, error)
+        results.append((corpusdir, outputdir, seconds, error))
+
+    if jobs == 1:
+        for corpusdir, outputdir in problems:
+            finish(corpusdir, outputdir,
+                   run_problem(corpusdir, outputdir, options))
+        return results
+
+    workers = jobs or os.cpu_count()
+    # If the metrics are enabled, the workers send them back with every
+    # result (see burrows02.load_texts).
+    measured = metrics.enabled
+    with ProcessPoolExecutor(
+            workers, initializer=instrumentation.enable if measured else None) \
+            as executor:
+        futures = {executor.submit(run_problem, corpusdir, outputdir, options,
+                                   measured):
+                   (corpusdir, outputdir)
+                   for corpusdir, outputdir in problems}
+        for future in as_completed(futures):
+            corpusdir, outputdir = futures[future]
+            finish(corpusdir, outputdir, future.result())
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Solve several tira problems in one run.')
+    parser.add_argument('-i',
+                        action='store',
+                        required=True,
+                        help='Path to a manifest with one line per problem: '
+                             'the input and the output directory separated '
+                             'by a tab')
+    parser.add_argument('--jobs',
+                        action='store',
+                        type=int,
+                        default=0,
+                        help='Number of worker processes, each solving one '
+                             'problem at a time (0 for one per CPU)')
+    add_tira_arguments(parser)
+    parser.add_argument('--metrics',
+                        action='store',
+                        help='Path where a JSON report of the time spent in '
+                             'every stage of all problems is written')
+
+    args = vars(parser.parse_args())
+
+    problems = read_manifest(args['i'])
+
+    if args['metrics']:
+        metrics.enable()
+    results = batch(problems, jobs=args['jobs'], **tira_options(args))
+    if args['metrics']:
+        metrics.write(args['metrics'])
+
+    failed = [corpusdir for corpusdir, outputdir, seconds, error in results
+              if error is not None]
+    if failed:
+        logging.error("Batch: %d of %d problems failed.", len(failed),
+                      len(results))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    # execute only if run as a script
+    logging.basicConfig(level=logging.ERROR,
+                        format='%(asctime)s %(levelname)s: %(message)s')
+    main()
@@ -0,0 +1,374 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+from multiprocessing import get_context
+
+import burrows02
+import jsonhandler
+from burrows02 import Author, Database, Text, delta_matrix
+from corpus import open_corpus
+
+
+STAGES = ("read", "tokenize", "database", "author_zscores", "text_zscores",
+          "delta")
+
+
+def make_vocabulary(size, random):
+    """
+    Return size distinct alphabetic words which are not changed by the
+    tokenizer, i.e. lowercase words of random syllables.
+    """
+    consonants = "bcdfghjklmnprstvwz"
+    vowels = "aeiou"
+    words = {}
+    while len(words) < size:
+        word = "".join(random.choice(consonants) + random.choice(vowels)
+                       for i in range(random.randint(1, 4)))
+        words[word] = None
+    return list(words)
+
+
+def make_text(words, cum_weights, length, random):
+    """
+    Return a text of about length words drawn with the given cumulative
+    weights, split into sentences and lines.
+    """
+    tokens = random.choices(words, cum_weights=cum_weights, k=length)
+    sentences = []
+    start = 0
+    while start < len(tokens):
+        stop = start + random.randint(5, 20)
+        sentence = tokens[start:stop]
+        sentence[0] = sentence[0].capitalize()
+        sentences.append(" ".join(sentence) + random.choice(".,;"))
+        start = stop
+    lines = []
+    for start in range(0, len(sentences), 4):
+        lines.append(" ".join(sentences[start:start + 4]))
+    return "\n".join(lines) + "\n"
+
+
+def generate_corpus(path, authors=10, texts=5, unknowns=2, length=1000,
+                    vocabulary=5000, exponent=1.1, seed=0):
+    """
+    Generate a synthetic corpus in the layout of jsonhandler.loadJson,
+    i.e. a meta-file.json, a ground-truth.json, one directory of training
+    texts per candidate author and a directory of unknown texts.
+
+    The words are drawn from a Zipfian distribution over a synthetic
+    vocabulary. Every author has his own preferences, i.e. the weights of
+    the words are multiplied by random factors per author, such that the
+    unknown texts can actually be attributed.
+
+    Keyword arguments:
+    path -- Path to the directory of the corpus. It is created if necessary.
+    authors -- Number of candidate authors. (default 10)
+    texts -- Number of training texts per author. (default 5)
+    unknowns -- Number of unknown texts per author. (default 2)
+    length -- Mean number of words of a text. The lengths vary by
+              +-50%. (default 1000)
+    vocabulary -- Number of distinct words. (default 5000)
+    exponent -- Exponent of the Zipfian distribution. (default 1.1)
+    seed -- Seed of the random number generator. (default 0)
+    """
+    random_state = random.Random(seed)
+    words = make_vocabulary(vocabulary, random_state)
+    weights = [1 / rank ** exponent for rank in range(1, vocabulary + 1)]
+
+    os.makedirs(os.path.join(path, "unknown"), exist_ok=True)
+    candidates = []
+    unknown_texts = []
+    ground_truth = []
+    for a in range(authors):
+        name = "candidate%05d" % (a + 1)
+        candidates.append({"author-name": name})
+        os.makedirs(os.path.join(path, name), exist_ok=True)
+
+        cum_weights = []
+        total = 0
+        for weight in weights:
+            total += weight * random_state.lognormvariate(0, 0.5)
+            cum_weights.append(total)
+
+        def text():
+            return make_text(words, cum_weights,
+                             random_state.randint(length // 2,
+                                                  length * 3 // 2),
+                             random_state)
+
+        for t in range(texts):
+            with open(os.path.join(path, name, "known%05d.txt" % (t + 1)),
+                      "w", encoding="utf-8") as f:
+                f.write(text())
+        for u in range(unknowns):
+            fname = "unknown%05d.txt" % (len(unknown_texts) + 1)
+            with open(os.path.join(path, "unknown", fname), "w",
+                      encoding="utf-8") as f:
+                f.write(text())
+            unknown_texts.append({"unknown-text": fname})
+            ground_truth.append({"unknown-text": fname, "true-author": name})
+
+    with open(os.path.join(path, jsonhandler.META_FNAME), "w") as f:
+        json.dump({"folder": "unknown", "language": "EN", "encoding": "UTF8",
+                   "candidate-authors": candidates,
+                   "unknown-texts": unknown_texts}, f, indent=2)
+    with open(os.path.join(path, jsonhandler.GT_FNAME), "w") as f:
+        json.dump({"ground-truth": ground_truth}, f, indent=2)
+
+
+def peak_memory():
+    """Return the peak resident set size of this process in KiB."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run(corpusdir, considered_words=150, vectorized=True, pos_tag=False):
+    """
+    Run the pipeline once on a corpus and measure every stage. Returns a
+    dictionary which maps every stage (see STAGES) to its wall time and the
+    peak memory of the process after it, together with the accuracy.
+
+    The peak memory is that of the whole process, so every run should
+    happen in a fresh process (see benchmark).
+    """
+    stages = {}
+
+    def stage(name):
+        nonlocal start
+        now = time.perf_counter()
+        stages[name] = {"time": now - start, "peak_memory": peak_memory()}
+        logging.info("Benchmark: %s took %.3f s.", name, now - start)
+        start = time.perf_counter()
+
+    start = time.perf_counter()
+    corpus = open_corpus(corpusdir)
+    trainings = [[corpus.read(corpus.training_key(candidate, training))
+                  for training in corpus.trainings[candidate]]
+                 for candidate in corpus.candidates]
+    unknowns = [corpus.read(corpus.unknown_key(unknown))
+                for unknown in corpus.unknowns]
+    stage("read")
+
+    trainings = [[Text(raw, candidate + " " + training, pos_tag=pos_tag)
+                  for raw, training in zip(raws, corpus.trainings[candidate])]
+                 for candidate, raws in zip(corpus.candidates, trainings)]
+    unknowns = [Text(raw, name, pos_tag=pos_tag)
+                for raw, name in zip(unknowns, corpus.unknowns)]
+    for text in unknowns:
+        text.compact()
+    for texts in trainings:
+        for text in texts:
+            text.compact()
+    stage("tokenize")
+
+    database = Database(considered_words, real_words=True,
+                        vectorized=vectorized)
+    for candidate, texts in zip(corpus.candidates, trainings):
+        author = Author(candidate)
+        author.add_text(*texts)
+        database.add_author(author)
+    database.process()
+    stage("database")
+
+    database.calc_zscores()
+    stage("author_zscores")
+
+    if vectorized:
+        zscores, mask = database.text_zscores(unknowns)
+    else:
+        for text in unknowns:
+            text.calc_zscores(database)
+    stage("text_zscores")
+
+    if vectorized:
+        deltas = delta_matrix(zscores, database.author_zscores(), mask)
+        closest = [database.authors[i].name for i in deltas.argmin(axis=1)]
+    else:
+        closest = []
+        for text in unknowns:
+            deltas = [text.calc_delta(database, author)
+                      for author in database.authors]
+            closest.append(
+                database.authors[deltas.index(min(deltas))].name)
+    stage("delta")
+
+    correct = sum(author == true_author for author, true_author
+                  in zip(closest, corpus.true_authors()))
+    return {
+        "stages": stages,
+        "total_time": sum(stage["time"] for stage in stages.values()),
+        "peak_memory": peak_memory(),
+        "accuracy": correct / len(closest) if closest else 0,
+    }
+
+
+def benchmark(authors=(10,), texts=(5,), lengths=(1000,),
+              considered_words=(150,), backends=("vectorized",), unknowns=2,
+              vocabulary=5000, exponent=1.1, repeat=1, seed=0, corpora=None):
+    """
+    Benchmark every combination of the given settings. For every
+    combination of authors, texts and lengths a corpus is generated
+    (see generate_corpus) and the pipeline is run (see run) for every
+    number of considered words and backend ("vectorized" or "dict").
+    Every run happens in a fresh process such that the measurements do
+    not influence each other. Returns the list of the results.
+
+    Keyword arguments:
+    corpora -- Directory in which the corpora are kept. If None then they
+               are generated in a temporary directory. (default None)
+    The other arguments are the settings (see generate_corpus and run).
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_authors, n_texts, length in product(authors, texts, lengths):
+            corpusdir = os.path.join(corpora or tmp, "corpus-%d-%d-%d-%d" % (
+                n_authors, n_texts, length, seed))
+            generate_corpus(corpusdir, authors=n_authors, texts=n_texts,
+                            unknowns=unknowns, length=length,
+                            vocabulary=vocabulary, exponent=exponent,
+                            seed=seed)
+            for words, backend, i in product(considered_words, backends,
+                                             range(repeat)):
+                with ProcessPoolExecutor(
+                        1, mp_context=get_context("spawn")) as executor:
+                    result = executor.submit(
+                        run, corpusdir + os.sep, words,
+                        backend == "vectorized").result()
+                result.update({
+                    "authors": n_authors,
+                    "texts": n_texts,
+                    "unknowns": n_authors * unknowns,
+                    "length": length,
+                    "considered_words": words,
+                    "backend": backend,
+                    "repetition": i,
+                })
+                logging.info("Benchmark: %s", result)
+                results.append(result)
+    return results
+
+
+def environment():
+    """Describe the environment of a benchmark run."""
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "numpy": burrows02.np.__version__ if burrows02.np else None,
+        "cpus": os.cpu_count(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark of the stages of Delta on synthetic corpora.')
+    parser.add_argument('-o',
+                        action='store',
+                        help='Path to the output file of the results '
+                             '(default: standard output)')
+    parser.add_argument('--label',
+                        action='store',
+                        help='Label of the results, e.g. the version')
+    parser.add_argument('--generate',
+                        action='store',
+                        help='Only generate a corpus (with the first of the '
+                             'given settings) in this directory')
+    parser.add_argument('--corpora',
+                        action='store',
+                        help='Directory in which the generated corpora are '
+                             'kept (default: a temporary directory)')
+    parser.add_argument('--authors',
+                        action='store',
+                        type=int,
+                        nargs='+',
+                        default=[10],
+                        help='The numbers of candidate authors')
+    parser.add_argument('--texts',
+                        action='store',
+                        type=int,
+                        nargs='+',
+                        default=[5],
+                        help='The numbers of training texts per author')
+    parser.add_argument('--unknowns',
+                        action='store',
+                        type=int,
+                        default=2,
+                        help='The number of unknown texts per author')
+    parser.add_argument('--length',
+                        action='store',
+                        type=int,
+                        nargs='+',
+                        default=[1000],
+                        help='The mean numbers of words of the texts')
+    parser.add_argument('--vocabulary',
+                        action='store',
+                        type=int,
+                        default=5000,
+                        help='The number of distinct words')
+    parser.add_argument('--exponent',
+                        action='store',
+                        type=float,
+                        default=1.1,
+                        help='The exponent of the Zipfian distribution')
+    parser.add_argument('--considered-words',
+                        action='store',
+                        type=int,
+                        nargs='+',
+                        default=[150],
+                        help='The numbers of considered words')
+    parser.add_argument('--backend',
+                        action='store',
+                        nargs='+',
+                        choices=['vectorized', 'dict'],
+                        default=['vectorized'],
+                        help='The backends of the database')
+    parser.add_argument('--repeat',
+                        action='store',
+                        type=int,
+                        default=1,
+                        help='Number of runs of every setting')
+    parser.add_argument('--seed',
+                        action='store',
+                        type=int,
+                        default=0,
+                        help='Seed of the corpus generator')
+
+    args = vars(parser.parse_args())
+
+    if args['generate']:
+        generate_corpus(args['generate'], authors=args['authors'][0],
+                        texts=args['texts'][0], unknowns=args['unknowns'],
+                        length=args['length'][0],
+                        vocabulary=args['vocabulary'],
+                        exponent=args['exponent'], seed=args['seed'])
+        return
+
+    results = benchmark(authors=args['authors'], texts=args['texts'],
+                        lengths=args['length'],
+                        considered_words=args['considered_words'],
+                        backends=args['backend'], unknowns=args['unknowns'],
+                        vocabulary=args['vocabulary'],
+                        exponent=args['exponent'], repeat=args['repeat'],
+                        seed=args['seed'], corpora=args['corpora'])
+    report = {"label": args['label'], "environment": environment(),
+              "results": results}
+    if args['o']:
+        with open(args['o'], "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+
+if __name__ == "__main__":
+    # execute only if run as a script
+    logging.basicConfig(level=logging.ERROR,
+                        format='%(asctime)s %(levelname)s: %(message)s')
+    main()
@@ -1,22 +1,38 @@
-# import nltk
 import logging
+import math
 import string
-from statistics import mean, stdev, StatisticsError
-# from nltk import word_tokenize
-from collections import Counter
+from array import array
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice, repeat
 import logging
 import codecs
+import json
+import os
+import re
 import string
+import countcache
+from answers import AnswerWriter, make_answers
+from corpus import open_corpus
+import tokenizer as tokenizers
+import instrumentation
+from instrumentation import metrics, profile
 import jsonhandler
 import sys
+from vocabulary import vocabulary
 import argparse
 
+try:
+    import numpy as np
+except ImportError:  # the matrix backend is optional
+    np = None
+
 
 class Database:
 
     """A database contains authors of texts."""
 
-    def __init__(self, considered_words=0, real_words=False):
+    def __init__(self, considered_words=0, real_words=False, vectorized=False):
         """
         Initialize a database.
 
@@ -29,20 +45,60 @@ class Database:
                       should be used for the algorithm. If False then also
                       words like '.', ';' etc. are considered.
                       (default False)
+        vectorized -- Specifies if the zscores of texts and authors are
+                      held as NumPy matrices, such that texts can be
+                      scored with one delta matrix (see text_zscores and
+                      author_zscores). The mean frequencies and standard
+                      deviations are derived from the same sums in both
+                      cases (see WordStatistics), only their vectors are
+                      NumPy arrays. Requires NumPy. (default False)
         """
+        if vectorized and np is None:
+            raise ImportError("The vectorized backend requires NumPy.")
 
         # The following list contains all authors
         # of the database.
         self.authors = []
 
         # The following counter object contains all
-        # words of the database and their respective
-        # number of occurrences.
+        # considered words of the database and their
+        # respective number of occurrences.
         self.counter = Counter()
 
+        # The following object contains the sufficient
+        # statistics of all words of the database (see
+        # WordStatistics). It is None if the database
+        # has not been counted yet. Afterwards, it is
+        # updated whenever authors or texts are added
+        # or removed.
+        self.statistics = None
+
+        # The following dictionary maps every author
+        # to his version (see Author.version) when his
+        # statistics were merged into self.statistics,
+        # such that process notices authors whose texts
+        # have been changed directly.
+        self.versions = {}
+
+        # The following dictionary maps the vocabulary
+        # ID of every word to the first author who uses
+        # it. Ties in the ranking are broken by the first
+        # occurrence of the words.
+        self.first = {}
+
+        # The following list contains all words of the
+        # database (restricted to real words if desired)
+        # and their number of occurrences as tuples,
+        # sorted by the number of occurrences. The
+        # considered words are a prefix of this list.
+        # It is None if the database has to be ranked
+        # again.
+        self.ranking = None
+        self._ranked_real_words = real_words
+
         # The following two dictionaries contain the
         # mean frequencies and standard deviations of
-        # the words in the database respectively.
+        # the considered words respectively.
         # This is with respect to the set of all texts
         # in the database.
         self.mean = {}
@@ -66,10 +122,116 @@ class Database:
         # also interpunctuation).
         self.real_words = real_words
 
+        # The following boolean value decides if the
+        # matrix backend is used.
+        self.vectorized = vectorized
+
+        # The following list contains the considered
+        # words and the following dictionary maps their
+        # vocabulary IDs to their position (column) in
+        # this list. The mean frequencies and standard
+        # deviations of the considered words are also
+        # held as vectors in this order (NumPy arrays
+        # for the matrix backend, arrays otherwise).
+        self.words = []
+        self.columns = {}
+        self.mean_vector = None
+        self.stdev_vector = None
+
+        # An optional calibration.Calibration which turns
+        # the deltas of the authors into scores (see train).
+        self.calibration = None
+
     def add_author(self, *authors):
-        """Add an authors to the database."""
+        """
+        Add authors to the database. If the database has already been
+        counted, the statistics of the authors are merged into it.
+        """
         for author in authors:
             self.authors.append(author)
+            if self.statistics is not None:
+                author.calc_counter()
+                self.statistics.merge(author.statistics)
+                self.versions[author] = author.version
+                for i in author.ids:
+                    if i not in self.first:
+                        self.first[i] = author
+        self.changed()
+
+    def remove_author(self, *authors):
+        """
+        Remove authors from the database. If the database has already been
+        counted, the statistics of the authors are subtracted from it.
+        """
+        for author in authors:
+            position = self.authors.index(author)
+            del self.authors[position]
+            if self.statistics is not None:
+                self.statistics.merge(author.statistics, -1)
+                del self.versions[author]
+                self.find_first(author.ids, author, position)
+        self.changed()
+
+    def add_text(self, author, *texts):
+        """
+        Add processed texts to an author of this database and update
+        the statistics of the database.
+        """
+        author.add_text(*texts)
+        if self.statistics is None:
+            return
+        self.versions[author] = author.version
+        positions = {other: position
+                     for position, other in enumerate(self.authors)}
+        for text in texts:
+            self.statistics.add(text)
+            for i in text.ids:
+                first = self.first.get(i)
+                if first is None or positions[first] > positions[author]:
+                    self.first[i] = author
+        self.changed()
+
+    def remove_text(self, author, *texts):
+        """
+        Remove texts of an author of this database and update the
+        statistics of the database.
+        """
+        author.remove_text(*texts)
+        if self.statistics is None:
+            return
+        self.versions[author] = author.version
+        for text in texts:
+            self.statistics.add(text, -1)
+            self.find_first(text.ids, author, self.authors.index(author))
+        self.changed()
+
+    def find_first(self, ids, author, position):
+        """
+        Find the first author of the given words again if it has been
+        the given author (which is or was at the given position) and
+        the author does not use them anymore.
+        """
+        remaining = author.statistics.positions \
+            if author in self.authors else {}
+        for i in ids:
+            if self.first.get(i) is not author or i in remaining:
+                continue
+            del self.first[i]
+            for other in self.authors[position:]:
+                if i in other.statistics.positions:
+                    self.first[i] = other
+                    break
+
+    def changed(self):
+        """
+        Mark the database as changed, i.e. it has to be ranked again and
+        the statistics of the considered words have to be recalculated.
+        """
+        if self.statistics is not None:
+            self.txt_number = self.statistics.txt_number
+        self.ranking = None
+        self.mean = {}
+        self.stdev = {}
 
     def calc_counter(self):
         """
@@ -77,134 +239,287 @@ class Database:
         and how many texts there are.
         """
         logging.info("Database: Counting.")
+        self.statistics = WordStatistics()
+        self.first = {}
+        self.versions = {}
         for author in self.authors:
             author.calc_counter()
-            self.counter += author.counter
-            self.txt_number += author.txt_number
-
-        # Restrict the words to those who contain only *real* words
-        if self.real_words is True:
-            # The key k is a tuple of the form (word, tag).
-            # We check if the first argument is a real word in the
-            # sense that it contains at least one alphabetic character (a-zA-Z)
-            # such that words like "middle-age" or "I'll" are accepted.
-            self.counter = Counter({k: v for k, v in dict(self.counter).items()
-                                    if sum(c in string.ascii_letters for c in k[0]) > 0})
-
-        # Restrict the number of words used for the calculations
+            with metrics.timer("count"):
+                self.statistics.merge(author.statistics)
+                self.versions[author] = author.version
+                for i in author.ids:
+                    if i not in self.first:
+                        self.first[i] = author
+        self.txt_number = self.statistics.txt_number
+        self.rank()
+
+    def rank(self):
+        """
+        Rank the words of the database by their number of occurrences.
+        Ties are broken by the first occurrence of the words, i.e. by
+        their first author and their first occurrence in the texts of
+        this author. calc_counter has to be executed before.
+        """
+        with metrics.timer("rank"):
+            positions = {author: position
+                         for position, author in enumerate(self.authors)}
+            statistics = self.statistics
+            ranking = []
+            for i, position in statistics.positions.items():
+                count = statistics.counts[position]
+                if count == 0:
+                    continue
+                word = vocabulary.words[i]
+                # Restrict the words to those who contain only *real* words
+                if self.real_words is True and not is_real_word(word):
+                    # The key is a tuple of the form (word, tag).
+                    # We check if the first argument is a real word in the
+                    # sense that it contains at least one alphabetic character
+                    # (a-zA-Z) such that words like "middle-age" or "I'll"
+                    # are accepted.
+                    continue
+                first = self.first[i]
+                ranking.append((-count, positions[first],
+                                first.statistics.positions[i], word))
+            ranking.sort()
+            self.ranking = [(word, -count) for count, _, _, word in ranking]
+            self._ranked_real_words = self.real_words
+        self.select_words()
+
+    def select_words(self):
+        """
+        Restrict the counter to the considered_words most common words
+        of the ranking. calc_counter has to be executed before.
+        """
         if self.considered_words > 0:
-            n = self.considered_words
-            # The following code takes the n most_common words
-            # in the database (this yields a list of tuples)
-            # and converts it to a dictionary and then again
-            # to a counter.
-            self.counter = Counter(dict(self.counter.most_common(n)))
+            self.counter = Counter(dict(self.ranking[:self.considered_words]))
+        else:
+            self.counter = Counter(dict(self.ranking))
 
     def calc_mean_stdev(self):
         """
         Calculate the mean frequencies and standard deviation
-        of every word in the database.
+        of every considered word in the database.
         calc_counter has to be executed before.
         """
 
         logging.info("Database: Calculating mean and stdev.")
-        for word in self.counter:
-            word_scores = []
-            for author in self.authors:
-                for text in author.texts:
-                    if word in text.scores:
-                        word_scores.append(text.scores[word])
-                    else:  # word is *not* in text.scores,
-                          # i.e. score (frequency) = 0
-                        word_scores.append(0)
-
-            self.mean[word] = mean(word_scores)
-            try:
-                self.stdev[word] = stdev(word_scores, self.mean[word])
-            except StatisticsError:
-                # could happen if a word occurs only in one text
-                logging.debug(
-                    "Database: Calculating mean and stdev: StatisticsError")
-                self.stdev[word] = 0
+        with metrics.timer("mean_stdev"):
+            self.words = list(self.counter)
+            ids = [vocabulary.id(word) for word in self.words]
+            self.columns = {i: column for column, i in enumerate(ids)}
+            self.mean_vector, self.stdev_vector = \
+                self.statistics.mean_stdev(ids, self.vectorized)
+            self.mean = dict(zip(self.words, self.mean_vector))
+            self.stdev = dict(zip(self.words, self.stdev_vector))
 
     def process(self):
         """
         Process the Database, i.e. count all words and determine
         their mean frequencies and standard deviation with respect
         to all texts.
+        If the database has already been counted, it is only ranked
+        again (if authors or texts have been added or removed since)
+        and the considered words are selected again. No text is
+        counted again. If texts have been added to or removed from an
+        author directly (see Author.add_text) instead of through the
+        database, the statistics of all authors are merged again.
         """
-        self.calc_counter()
+        if self.statistics is not None and any(
+                self.versions.get(author) != author.version
+                for author in self.authors):
+            logging.info("Database: Authors have changed, merging again.")
+            self.statistics = None
+        if self.statistics is None:
+            self.calc_counter()
+        elif self.ranking is None or self._ranked_real_words != self.real_words:
+            self.rank()
+        else:
+            self.select_words()
         self.calc_mean_stdev()
 
+    def calc_zscores(self):
+        """
+        Calculate the zscores of all authors with respect to this database.
+        The mean frequencies of an author are only calculated again if
+        texts of the author have been added or removed (see
+        Author.calc_cmsz). process has to be executed before.
+        """
+        for author in self.authors:
+            if author.mean is None:
+                author.calc_counter()
+                author.calc_mean_stdev(self.vectorized)
+            author.calc_zscores(self)
+
+    def text_zscores(self, texts, full=False):
+        """
+        Return the zscore matrix of the given texts with respect to this
+        vectorized database together with a boolean mask which marks the
+        words that occur in the respective text. Words which do not occur
+        in a text have a zscore of 0 (cf. Text.calc_zscores) unless full
+        is True (see standardize). process has to be executed before.
+        """
+        return zscore_matrix(texts, self.columns, self.mean_vector,
+                             self.stdev_vector, full)
+
+    def author_zscores(self, full=False):
+        """
+        Return the zscore matrix of all authors of this vectorized database
+        with one row per author (in the order of self.authors). Words
+        without an author zscore get a zscore of 0 (cf. Text.calc_delta)
+        or, if full is True, the zscore of the frequency 0.
+        calc_zscores has to be executed for every author before.
+        """
+        zscores = np.zeros((len(self.authors), len(self.words)))
+        for row, author in enumerate(self.authors):
+            zscores[row] = author.zscores
+        if full:
+            absent = -self.mean_vector / np.where(self.stdev_vector != 0,
+                                                  self.stdev_vector, 1)
+            absent[self.stdev_vector == 0] = 0
+            for row, author in enumerate(self.authors):
+                present = np.zeros(len(self.words), dtype=bool)
+                columns = [self.columns.get(i, -1) for i in author.ids]
+                columns = np.array([c for c in columns if c >= 0],
+                                   dtype=np.intp)
+                present[columns] = True
+                zscores[row, ~present] = absent[~present]
+        return zscores
+
 
 class Author:
 
     """Represents an author with a collection of his texts."""
 
+    __slots__ = ("name", "texts", "txt_number", "statistics",
+                 "mean", "stdev", "zscores", "version")
+
     def __init__(self, name):
         self.name = name           # the author's name
         self.texts = []            # a list of the author's text
-        self.counter = Counter()   # a counter of all words of the author
 
-        # The following two dictionaries contain
+        # The following object contains the sufficient
+        # statistics of the words of the author's texts
+        # (see WordStatistics). It is None until the
+        # author is counted.
+        self.statistics = None
+
+        # The following two arrays contain
         # the mean frequencies and their standard
-        # deviation with respect to the set of all
-        # texts of this author.
-        self.mean = {}
-        self.stdev = {}
+        # deviation of the words in self.ids with
+        # respect to the set of all texts of this
+        # author. They are None if they have to be
+        # calculated (again).
+        self.mean = None
+        self.stdev = None
 
         self.txt_number = 0   # the number of texts of this author
 
-        # The following dictionary contains the
-        # zscores of this author's words again
-        # with respect to the set of all texts of
-        # this author
-        self.zscores = {}
-
-        # Has the counter already been calculated?
-        self.__counter_calculated = False
+        # The following number is incremented whenever
+        # texts are added or removed, such that a database
+        # notices changes of its authors (see
+        # Database.process).
+        self.version = 0
+
+        # The following array contains the zscores
+        # of this author's words with respect to a
+        # database, indexed by the database's columns
+        # (see Database.columns). Words the author does
+        # not use have a zscore of 0.
+        self.zscores = array("d")
+
+    @classmethod
+    def from_statistics(cls, name, statistics):
+        """
+        Create an author of the statistics of his texts (see WordStatistics),
+        e.g. of statistics which have been merged from several processes.
+        The author has no texts, so texts can be added to him but not
+        removed.
+        """
+        author = cls(name)
+        author.statistics = statistics
+        author.txt_number = statistics.txt_number
+        return author
+
+    @property
+    def ids(self):
+        """An array of all words of the author (as vocabulary IDs)."""
+        if self.statistics is None:
+            return array("q")
+        return self.statistics.ids
+
+    @property
+    def counts(self):
+        """An array of the number of occurrences of the words in self.ids."""
+        if self.statistics is None:
+            return array("q")
+        return self.statistics.counts
+
+    @property
+    def counter(self):
+        """A counter of all words of the author."""
+        return Counter(dict(zip(map(vocabulary.words.__getitem__, self.ids),
+                                self.counts)))
 
     def add_text(self, *texts):
-        """Add texts to this author."""
+        """
+        Add processed texts to this author. If the author has already been
+        counted, the texts are added to its statistics.
+        """
         for text in texts:
             self.texts.append(text)
             self.txt_number += 1
+            if self.statistics is not None:
+                self.statistics.add(text)
+        self.version += 1
+        self.mean = None
+        self.stdev = None
+
+    def remove_text(self, *texts):
+        """
+        Remove texts from this author. If the author has already been
+        counted, it is counted again (only its own texts) such that the
+        order of its words is the same as if the texts had never been
+        added.
+        """
+        for text in texts:
+            self.texts.remove(text)
+            self.txt_number -= 1
+        if self.statistics is not None:
+            self.statistics = None
+            self.calc_counter()
+        self.version += 1
+        self.mean = None
+        self.stdev = None
 
     def calc_counter(self):
         """Count the occurrences of every word in texts of this author."""
 
-        if not self.__counter_calculated:
+        if self.statistics is None:
             logging.info("Author '%s': Calculating Counter.", self.name)
-            for text in self.texts:
-                self.counter += text.counter
-            self.__counter_calculated = True
+            with metrics.timer("count"):
+                self.statistics = WordStatistics()
+                for text in self.texts:
+                    self.statistics.add(text)
         else:
-            logging.info("Author '%s': Counter has already been calculated.",
-                         self.name)
+            logging.info("Author '%s': Counter is up to date.", self.name)
 
-    def calc_mean_stdev(self):
+    def calc_mean_stdev(self, vectorized=False):
         """
         Calculate the mean frequencies and standard deviation of every word.
         calc_counter has to be executed before
+
+        Keyword arguments:
+        vectorized -- Calculate the vectors with NumPy (see
+                      WordStatistics.mean_stdev). (default False)
         """
         logging.info("Author '%s': Calculating mean and stdev.", self.name)
-        for word in self.counter:
-            word_scores = []
-            for text in self.texts:
-                if word in text.scores:
-                    word_scores.append(text.scores[word])
-                else:
-                    # word is *not* in text, i.e. score (frequency) is 0!
-                    word_scores.append(0)
-
-            self.mean[word] = mean(word_scores)
-            try:
-                self.stdev[word] = stdev(word_scores, self.mean[word])
-            except StatisticsError:
-                # This happens, for example, if the author has only one text
-                logging.debug("Author '%s': Calculating mean" +
-                              "and stdev: StatisticsError", self.name)
-                self.stdev[word] = 0
+        with metrics.timer("mean_stdev"):
+            means, stdevs = self.statistics.mean_stdev(self.ids, vectorized)
+            if vectorized:
+                means = array("d", means.tolist())
+                stdevs = array("d", stdevs.tolist())
+            self.mean, self.stdev = means, stdevs
 
     def calc_zscores(self, database):
         """
@@ -213,16 +528,18 @@ class Author:
         they have an expected value of 0 and a variance of 1).
         calc_mean_stdev has to be executed before
         """
-        for word in self.counter:
-            # We have to check if the word is in the database's counter because
-            # the database's might be restricted, e.g. most common words or
-            # only real words. (see the comments of Database.calc_counter())
-            if word in database.counter:
-                if database.stdev[word] != 0:
-                    self.zscores[word] = (self.mean[word] - database.mean[word]) \
-                        / database.stdev[word]
-                else:
-                    self.zscores[word] = 0
+        with metrics.timer("zscores"):
+            self.zscores = array("d", bytes(8 * len(database.words)))
+            for i, word_mean in zip(self.ids, self.mean):
+                # We have to check if the word is in the database's counter
+                # because the database's might be restricted, e.g. most common
+                # words or only real words. (see the comments of
+                # Database.calc_counter())
+                column = database.columns.get(i)
+                if column is not None and database.stdev_vector[column] != 0:
+                    self.zscores[column] = \
+                        (word_mean - database.mean_vector[column]) \
+                        / database.stdev_vector[column]
 
     def calc_cmsz(self, database):
         """
@@ -230,7 +547,7 @@ class Author:
         this author with respect to the specified database
         """
         self.calc_counter()
-        self.calc_mean_stdev()
+        self.calc_mean_stdev(database.vectorized)
         self.calc_zscores(database)
 
 
@@ -238,7 +555,12 @@ class Text:
 
     """Represents a single text."""
 
-    def __init__(self, raw, name, process=True, pos_tag=True):
+    # Texts are the most numerous objects, so they have no __dict__
+    # and store their words as arrays of vocabulary IDs.
+    __slots__ = ("name", "raw", "tokens", "tags", "ids", "counts", "sum",
+                 "zscore_columns", "zscores")
+
+    def __init__(self, raw, name, process=True, pos_tag=True, tokenizer=None):
         """
         Initialize a text object with raw text.
 
@@ -247,20 +569,83 @@ class Text:
         name -- Name of the text.
         process -- If true then directly process the text. (default: True)
         pos_tag -- Should the raw text be POS tagged? (default: True)
+        tokenizer -- A tokenizer.Tokenizer which is used instead of the
+                     default tokenizer of the pos_tag setting.
+                     (default: None)
         """
         self.name = name
         self.raw = raw
         self.tokens = []
         self.tags = []
-        self.counter = Counter()
-        self.scores = {}
-        self.zscores = {}
+
+        # The following two arrays contain all words of
+        # the text (as vocabulary IDs) and their respective
+        # number of occurrences.
+        self.ids = array("q")
+        self.counts = array("q")
+
+        # The following two arrays contain the zscores of
+        # the words of the text which are considered by a
+        # database and the columns of these words in the
+        # database (see Database.columns).
+        self.zscore_columns = array("q")
+        self.zscores = array("d")
         self.sum = 0  # number of words in self.raw
 
         if process:
-            self.process(pos_tag=pos_tag)
+            self.process(pos_tag=pos_tag, tokenizer=tokenizer)
+
+    @property
+    def counter(self):
+        """A counter of all words of the text."""
+        return Counter(dict(zip(map(vocabulary.words.__getitem__, self.ids),
+                                self.counts)))
+
+    @property
+    def scores(self):
+        """A dictionary of the frequencies/scores of all words of the text."""
+        return {vocabulary.words[i]: count / self.sum
+                for i, count in zip(self.ids, self.counts)}
+
+    @classmethod
+    def from_file(cls, path, name, pos_tag=True, encoding="utf-8",
+                  chunk_size=1 << 20, tokenizer=None):
+        """
+        Create a text object by streaming a file, i.e. the file is read,
+        tokenized and counted chunk by chunk and only the counter and the
+        scores of the text are kept (neither the raw text nor its tokens).
+
+        Keyword arguments:
+        path -- Path to the file.
+        name -- Name of the text.
+        pos_tag -- Should the raw text be POS tagged? (default: True)
+        encoding -- Encoding of the file. (default: "utf-8")
+        chunk_size -- Number of characters read at once. (default: 2**20)
+        tokenizer -- See __init__. (default: None)
+        """
+        with codecs.open(path, "r", encoding) as stream:
+            return cls.from_stream(stream, name, pos_tag=pos_tag,
+                                   chunk_size=chunk_size, tokenizer=tokenizer)
 
-    def process(self, pos_tag=True):
+    @classmethod
+    def from_stream(cls, stream, name, pos_tag=True, chunk_size=1 << 20,
+                    tokenizer=None):
+        """
+        Create a text object by streaming a text stream (see from_file),
+        e.g. a document of a corpus.Corpus.
+        """
+        text = cls(None, name, process=False)
+        counter = Counter()
+        logging.info("Streaming '%s'", name)
+        for chunk in read_chunks(stream, chunk_size):
+            text.raw = chunk
+            text.tokenize(pos_tag=pos_tag, tokenizer=tokenizer)
+            counter.update(text.tags)
+        text.compact()
+        text.count(counter)
+        return text
+
+    def process(self, pos_tag=True, tokenizer=None):
         """
         Process the text at hand, i.e. it is tokenized, tagged and
         counted. Moreover, we calculate the frequency/score of every word
@@ -268,30 +653,48 @@ class Text:
 
         Keyword arguments:
         pos_tag -- Should the raw text be POS tagged? (default: True)
+        tokenizer -- See __init__. (default: None)
         """
-        if pos_tag:
-            # A list of all tokens can be seen
-            # with nltk.help.upenn_tagset()
-            logging.info("Tokenizing '%s'", self.name)
-            self.tokens = nltk.word_tokenize(self.raw)
-            logging.info("Tagging '%s'", self.name)
-            self.tags = nltk.pos_tag(self.tokens)
-        else:
-            logging.info("Preparing '%s'", self.name)
-            # the following takes all alphabetic words normalized to lowercase
-            # from the raw data
-            self.tags = [x for x in
-                        [''.join(c for c in word if c.isalpha()).lower()
-                         for word in self.raw.split()]
-                         if x != '']
-
+        self.tokenize(pos_tag=pos_tag, tokenizer=tokenizer)
         logging.info("Counting '%s'", self.name)
-        self.counter = Counter(self.tags)
-        self.sum = sum(self.counter.values())
+        self.count(Counter(self.tags))
 
-        logging.info("Calculating the scores of '%s'", self.name)
-        for x in self.counter:
-            self.scores[x] = self.counter[x] / self.sum
+    def tokenize(self, pos_tag=True, tokenizer=None):
+        """
+        Tokenize (and tag) the raw text. The counted tokens are stored in
+        self.tags and, if they are (word, tag) tuples, the words in
+        self.tokens.
+
+        Keyword arguments:
+        pos_tag -- Should the raw text be POS tagged? (default: True)
+        tokenizer -- See __init__. (default: None)
+        """
+        tokenizer = tokenizers.get_tokenizer(pos_tag, tokenizer)
+        logging.info("Tokenizing '%s'", self.name)
+        with metrics.timer("tokenize"):
+            self.tags = tokenizer.tokenize(self.raw)
+        if tokenizer.tagged:
+            self.tokens = [word for word, tag in self.tags]
+        metrics.count("tokens", len(self.tags))
+
+    def count(self, counter):
+        """
+        Set the counter of this text, i.e. the words and their number of
+        occurrences.
+        """
+        with metrics.timer("count"):
+            self.ids = array("q", map(vocabulary.id, counter))
+            self.counts = array("q", counter.values())
+            self.sum = sum(self.counts)
+
+    def compact(self):
+        """
+        Drop the raw text, the tokens and the tags of this text.
+        Only the counter and the scores are needed for the algorithm.
+        """
+        self.raw = None
+        self.tokens = []
+        self.tags = []
 
     def calc_zscores(self, database):
         """
@@ -300,16 +703,19 @@ class Text:
         a variance of 1).
         process has to be executed before.
         """
-        logging.info("Calculating the zscores of '%s'", self.name)
-
-        for word in database.counter:
-            if word in self.counter:
-                if database.stdev[word] != 0:
-                    self.zscores[word] = (self.scores[word] - database.mean[word]) \
-                        / database.stdev[word]
-                else:
-                    self.zscores[word] = 0
-
+        with metrics.timer("zscores"):
+            self.zscore_columns = array("q")
+            self.zscores = array("d")
+            for i, count in zip(self.ids, self.counts):
+                column = database.columns.get(i)
+                if column is not None:
+                    self.zscore_columns.append(column)
+                    if database.stdev_vector[column] != 0:
+                        self.zscores.append(
+                            (count / self.sum - database.mean_vector[column])
+                            / database.stdev_vector[column])
+                    else:
+                        self.zscores.append(0)
 
     def calc_delta(self, database, author):
         """
@@ -317,109 +723,1026 @@ class Text:
         Specify a database and an author from this database.
         calc_zscores has to be executed before
         """
-        logging.info("Text '%s': Calculating delta for author '%s'.",
-                     self.name, author.name)
-        absolute_differences = {}
-        absolute_differences_sum = 0
-        for word in database.counter:
-            if word in self.counter:
-                if word in author.zscores:
-                    absolute_differences[word] = abs(
-                        self.zscores[word] - author.zscores[word])
-                else:
-                    absolute_differences[word] = abs(self.zscores[word])
-                absolute_differences_sum += absolute_differences[word]
-        return absolute_differences_sum  # / sum(self.counter.values())
+        # This is called for every pair of a text and an author, so it is
+        # neither logged nor timed (see closest_authors).
+        author_zscores = author.zscores
+        return sum(abs(zscore - author_zscores[column]) for column, zscore
+                   in zip(self.zscore_columns, self.zscores))
+
+
+class WordStatistics:
+
+    """
+    The sufficient statistics of the words of a set of texts: the number
+    of texts and for every word its number of occurrences, the sum of its
+    scores (relative frequencies) and of their squares and the number of
+    texts which contain it.
+
+    The mean frequencies and standard deviations of the words follow from
+    these sums, so texts can be added and removed and the statistics of
+    disjoint sets of texts can be merged without going over the texts
+    again. Only the words of the added or removed texts are touched.
+    """
+
+    __slots__ = ("ids", "positions", "counts", "sums", "squares", "texts",
+                 "txt_number")
+
+    def __init__(self):
+        # The following arrays contain the words (as
+        # vocabulary IDs) in the order of their first
+        # occurrence and their statistics. The dictionary
+        # maps every ID to its position in these arrays.
+        # Words whose texts have all been removed keep
+        # their position with statistics of 0.
+        self.ids = array("q")
+        self.positions = {}
+        self.counts = array("q")
+        self.sums = array("d")
+        self.squares = array("d")
+        self.texts = array("q")
+
+        self.txt_number = 0  # the number of texts
+
+    def position(self, i):
+        """Return the position of a word, which is added if necessary."""
+        position = self.positions.get(i)
+        if position is None:
+            position = self.positions[i] = len(self.ids)
+            self.ids.append(i)
+            self.counts.append(0)
+            self.sums.append(0)
+            self.squares.append(0)
+            self.texts.append(0)
+        return position
+
+    def add(self, text, sign=1):
+        """
+        Add a processed text to the statistics or, if sign is -1,
+        remove it.
+        """
+        self.txt_number += sign
+        for i, count in zip(text.ids, text.counts):
+            position = self.position(i)
+            score = count / text.sum
+            self.counts[position] += sign * count
+            self.sums[position] += sign * score
+            self.squares[position] += sign * score * score
+            self.texts[position] += sign
+            if self.texts[position] == 0:
+                # no rounding errors for words without texts
+                self.sums[position] = self.squares[position] = 0
+
+    def merge(self, other, sign=1):
+        """
+        Add the statistics of another set of texts or, if sign is -1,
+        subtract them.
+        """
+        self.txt_number += sign * other.txt_number
+        for i, position in other.positions.items():
+            own = self.position(i)
+            self.counts[own] += sign * other.counts[position]
+            self.sums[own] += sign * other.sums[position]
+            self.squares[own] += sign * other.squares[position]
+            self.texts[own] += sign * other.texts[position]
+            if self.texts[own] == 0:
+                self.sums[own] = self.squares[own] = 0
+
+    def to_dict(self):
+        """
+        Return the statistics as a dictionary of lists which can be stored
+        as JSON, e.g. to merge the statistics of several processes. The
+        words are stored as words instead of vocabulary IDs (which are
+        different in every process) in the order of their first occurrence.
+        """
+        return {
+            "txt_number": self.txt_number,
+            "words": [vocabulary.words[i] for i in self.ids],
+            "counts": self.counts.tolist(),
+            "sums": self.sums.tolist(),
+            "squares": self.squares.tolist(),
+            "texts": self.texts.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Create statistics of a dictionary (see to_dict)."""
+        statistics = cls()
+        statistics.txt_number = data["txt_number"]
+        # JSON has no tuples, so (word, tag) tokens are stored as lists.
+        statistics.ids = array("q", (
+            vocabulary.id(tuple(word) if isinstance(word, list) else word)
+            for word in data["words"]))
+        statistics.positions = {i: position
+                                for position, i in enumerate(statistics.ids)}
+        statistics.counts = array("q", data["counts"])
+        statistics.sums = array("d", data["sums"])
+        statistics.squares = array("d", data["squares"])
+        statistics.texts = array("q", data["texts"])
+        return statistics
+
+    def mean_stdev(self, ids, vectorized=False):
+        """
+        Return the vectors of the mean frequencies and the sample standard
+        deviations of the given words (NumPy arrays if vectorized, arrays
+        otherwise). As with statistics.stdev the standard deviation is 0
+        if there are less than two texts.
+        """
+        n = self.txt_number
+        positions = [self.positions.get(i) for i in ids]
+        sums = [0 if p is None else self.sums[p] for p in positions]
+        squares = [0 if p is None else self.squares[p] for p in positions]
+        if vectorized:
+            sums = np.array(sums, dtype=float)
+            squares = np.array(squares, dtype=float)
+            means = sums / max(n, 1)
+            if n < 2:
+                return means, np.zeros(len(ids))
+            return means, np.sqrt(np.maximum(
+                (squares - sums * means) / (n - 1), 0))
+
+        means = array("d", (total / max(n, 1) for total in sums))
+        if n < 2:
+            return means, array("d", bytes(8 * len(ids)))
+        return means, array("d", (
+            math.sqrt(max((square - total * mean) / (n - 1), 0))
+            for total, square, mean in zip(sums, squares, means)))
+
+
+def is_real_word(word):
+    """
+    Check if a word (or the first element of a (word, tag) tuple) is a
+    real word (see Database.calc_counter).
+    """
+    return sum(c in string.ascii_letters for c in word[0]) > 0
 
 
-def tira(corpusdir, outputdir):
+def count_file(path, pos_tag=True, stream=False, cache=None, tokenizer=None,
+               corpus=None):
     """
+    Tokenize and count the file at the given path and return its counter.
+
     Keyword arguments:
-    corpusdir -- Path to a tira corpus
-    outputdir -- Output directory
+    path -- Path to the file or, if corpus is given, the key of a document
+            of the corpus.
+    pos_tag -- Should the raw text be POS tagged? (default: True)
+    stream -- Stream the file (see Text.from_file). (default: False)
+    cache -- A countcache.CountCache. If the file is in the cache, it is
+             not tokenized at all, otherwise its counter is stored in the
+             cache. (default: None)
+    tokenizer -- See Text. (default: None)
+    corpus -- A corpus.Corpus. (default: None)
     """
-    pos_tag = False
+    if cache is not None:
+        digest = countcache.file_digest(path) if corpus is None \
+            else corpus.digest(path)
+        key = cache.key(digest, pos_tag if tokenizer is None else tokenizer.name,
+                        "utf-8" if corpus is None else corpus.encoding)
+        counter = cache.get(key)
+        if counter is not None:
+            logging.info("Cache hit for '%s'", path)
+            metrics.count("cache_hits")
+            return counter
+        metrics.count("cache_misses")
+
+    if stream:
+        with open_file(path, corpus) as f:
+            counter = Text.from_stream(f, path, pos_tag=pos_tag,
+                                       tokenizer=tokenizer).counter
+    else:
+        counter = Text(read_file(path, corpus), path, pos_tag=pos_tag,
+                       tokenizer=tokenizer).counter
+
+    if cache is not None:
+        cache.put(key, counter)
+    return counter
+
+
+def count_file_metrics(path, pos_tag=True, stream=False, cache=None,
+                       tokenizer=None, corpus=None):
+    """
+    Return the counter of a file (see count_file) and the metrics of
+    counting it (see instrumentation.Metrics.report).
+    """
+    metrics.reset()
+    counter = count_file(path, pos_tag, stream, cache, tokenizer, corpus)
+    return counter, metrics.report()
 
-    jsonhandler.loadJson(corpusdir)
-    jsonhandler.loadTraining()
 
+def read_file(path, corpus=None):
+    """
+    Return the content of a file as a string. If a corpus.Corpus is
+    given, path is the key of one of its documents.
+    """
+    with metrics.timer("read"):
+        if corpus is not None:
+            raw = corpus.read(path)
+        else:
+            with codecs.open(path, "r", "utf-8") as f:
+                raw = f.read()
+    metrics.count("characters", len(raw))
+    return raw
+
+
+def open_file(path, corpus=None):
+    """Open a file (or a document of a corpus) as a text stream."""
+    if corpus is not None:
+        return corpus.open(path)
+    return codecs.open(path, "r", "utf-8")
+
+
+def prefetch(function, items, depth=8):
+    """
+    Yield function(item) for every item in order, while the results of the
+    next depth items are already being computed by a pool of threads. This
+    overlaps reading files (which does not hold the GIL while it waits for
+    the disk or the network) with processing the previous ones.
+
+    At most depth results are in flight, i.e. a new item is only submitted
+    when a result has been taken, such that a slow consumer limits the
+    memory of the results that are waiting. If depth is 0 then the items
+    are processed one at a time without threads.
+    """
+    if depth <= 0:
+        for item in items:
+            yield function(item)
+        return
+    items = iter(items)
+    with ThreadPoolExecutor(min(depth, 8)) as executor:
+        pending = deque(executor.submit(function, item)
+                        for item in islice(items, depth))
+        try:
+            while pending:
+                result = pending.popleft().result()
+                for item in islice(items, 1):
+                    pending.append(executor.submit(function, item))
+                yield result
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def load_texts(files, pos_tag=True, stream=False, jobs=1, cache=None,
+               tokenizer=None, corpus=None, prefetch_depth=8):
+    """
+    Create a processed text object for every file. The texts are returned
+    in the order of the files.
+
+    Keyword arguments:
+    files -- A list of tuples of the form (path, name). If corpus is
+             given, the paths are keys of its documents.
+    pos_tag -- Should the raw text be POS tagged? (default: True)
+    stream -- Stream the files (see Text.from_file). (default: False)
+    jobs -- Number of worker processes. If it is larger than 1 the files are
+            tokenized and counted in a process pool and only the counters
+            are sent back, i.e. the texts do not keep their raw text.
+            If 0 then one process per CPU is used. (default: 1)
+    cache -- A countcache.CountCache for the counters of the files. If it
+             is used, the texts do not keep their raw text. (default: None)
+    tokenizer -- See Text. (default: None)
+    corpus -- A corpus.Corpus which contains the files. (default: None)
+    prefetch_depth -- Number of files which are read ahead by threads
+                      while the previous ones are tokenized (see prefetch)
+                      if they are neither streamed nor cached nor
+                      processed by workers. (default: 8)
+    """
+    metrics.count("texts", len(files))
+    if jobs == 1 and cache is None:
+        texts = []
+        if stream:
+            for path, name in files:
+                logging.info("Loading '%s'", name)
+                with open_file(path, corpus) as f:
+                    texts.append(Text.from_stream(f, name, pos_tag=pos_tag,
+                                                  tokenizer=tokenizer))
+            return texts
+        raws = prefetch(lambda path: read_file(path, corpus),
+                        [path for path, name in files], prefetch_depth)
+        for (path, name), raw in zip(files, raws):
+            logging.info("Loading '%s'", name)
+            texts.append(Text(raw, name, pos_tag=pos_tag, tokenizer=tokenizer))
+        return texts
+
+    paths = [path for path, name in files]
+    if jobs == 1:
+        counters = [count_file(path, pos_tag, stream, cache, tokenizer, corpus)
+                    for path in paths]
+    else:
+        workers = jobs or os.cpu_count()
+        # If the metrics are enabled, the workers send them back with
+        # every counter.
+        measured = metrics.enabled
+        with ProcessPoolExecutor(
+                workers,
+                initializer=instrumentation.enable if measured else None) \
+                as executor:
+            # map yields the results in the order of the paths, so the
+            # texts (and thus all counters built from them) are deterministic.
+            counters = list(executor.map(
+                count_file_metrics if measured else count_file, paths,
+                repeat(pos_tag), repeat(stream), repeat(cache),
+                repeat(tokenizer), repeat(corpus),
+                chunksize=max(1, len(paths) // (8 * workers))))
+        if measured:
+            for counter, report in counters:
+                metrics.merge(report)
+            counters = [counter for counter, report in counters]
+
+    texts = []
+    for (path, name), counter in zip(files, counters):
+        text = Text(None, name, process=False)
+        text.count(counter)
+        texts.append(text)
+    return texts
+
+
+def read_chunks(stream, chunk_size):
+    """
+    Read a text stream in chunks of about chunk_size characters.
+    Every chunk ends at a whitespace (preferably a line break) such that
+    no word is split between two chunks.
+    """
+    rest = ""
+    while True:
+        with metrics.timer("read"):
+            data = stream.read(chunk_size)
+        metrics.count("characters", len(data))
+        if not data:
+            break
+        data = rest + data
+        cut = data.rfind("\n") + 1
+        if cut == 0:
+            match = re.search(r"\s\S*\Z", data)
+            cut = match.start() + 1 if match else 0
+        rest = data[cut:]
+        if cut:
+            yield data[:cut]
+    if rest:
+        yield rest
+
+
+def frequency_matrix(texts, columns):
+    """
+    Return a matrix with one row per text and one column per word
+    which holds the scores (relative frequencies) of the texts.
+
+    Keyword arguments:
+    texts -- A list of processed texts.
+    columns -- A dictionary mapping the vocabulary ID of every word
+               to its column.
+    """
+    lookup = np.full(len(vocabulary), -1, dtype=np.intp)
+    lookup[np.fromiter(columns.keys(), dtype=np.intp, count=len(columns))] = \
+        np.fromiter(columns.values(), dtype=np.intp, count=len(columns))
+    matrix = np.zeros((len(texts), len(columns)))
+    for row, text in enumerate(texts):
+        text_columns = lookup[np.frombuffer(text.ids, dtype=np.int64)]
+        found = text_columns >= 0
+        matrix[row, text_columns[found]] = \
+            np.frombuffer(text.counts, dtype=np.int64)[found] / text.sum
+    return matrix
+
+
+def zscore_matrix(texts, columns, means, stdevs, full=False):
+    """
+    Return the zscore matrix of the given texts together with a boolean
+    mask which marks the words that occur in the respective text.
+    Words which do not occur in a text or have a standard deviation
+    of 0 get a zscore of 0.
+
+    Keyword arguments:
+    texts -- A list of processed texts.
+    columns -- A dictionary mapping the vocabulary ID of every word
+               to its column.
+    means -- The vector of the mean frequencies of the words.
+    stdevs -- The vector of the standard deviations of the words.
+    full -- See standardize. (default False)
+    """
+    with metrics.timer("zscores"):
+        return standardize(frequency_matrix(texts, columns), means, stdevs,
+                           full)
+
+
+def standardize(matrix, means, stdevs, full=False):
+    """
+    Return the zscores of a frequency matrix and the boolean mask of its
+    nonzero frequencies (see zscore_matrix). If full is True then the words
+    which do not occur in a text get the zscore of the frequency 0 instead
+    of 0 and the mask is None, i.e. all words are considered.
+    """
+    mask = matrix > 0
+    zscores = (matrix - means) / np.where(stdevs != 0, stdevs, 1)
+    zscores[:, stdevs == 0] = 0
+    if full:
+        return zscores, None
+    zscores[~mask] = 0
+    return zscores, mask
+
+
+def delta_matrix(query_zscores, author_zscores, query_mask=None,
+                 chunk_size=None):
+    """
+    Calculate the delta of every query text and every author at once.
+    Returns a matrix with one row per query text and one column per author.
+
+    Keyword arguments:
+    query_zscores -- The zscore matrix of the query texts.
+    author_zscores -- The zscore matrix of the authors.
+    query_mask -- A boolean matrix which marks the words that are
+                  considered for the respective query text. If None then
+                  all words are considered. (default None)
+    chunk_size -- The number of query texts that are scored in one pass.
+                  If None then it is chosen such that the intermediate
+                  matrix has at most 2**22 entries. If a single query
+                  text and all authors exceed this, the authors are
+                  scored in chunks as well. (default None)
+    """
+    queries, words = query_zscores.shape
+    authors = author_zscores.shape[0]
+    if chunk_size is None:
+        chunk_size = max(1, 2 ** 22 // max(1, authors * words))
+    author_chunk_size = max(1, 2 ** 22 // max(1, chunk_size * words))
+    deltas = np.empty((queries, authors))
+    with metrics.timer("delta"):
+        for start in range(0, queries, chunk_size):
+            stop = start + chunk_size
+            for first in range(0, authors, author_chunk_size):
+                last = first + author_chunk_size
+                differences = np.abs(
+                    query_zscores[start:stop, np.newaxis, :] -
+                    author_zscores[np.newaxis, first:last, :])
+                if query_mask is not None:
+                    differences *= query_mask[start:stop, np.newaxis, :]
+                deltas[start:stop, first:last] = differences.sum(axis=2)
+    metrics.count("deltas", queries * authors)
+    return deltas
+
+
+def rank_candidates(deltas, k=None):
+    """
+    Return the column indices of the authors of a delta matrix ranked by
+    their delta, i.e. the first column contains the closest author of
+    every query text. Ties are broken by the order of the authors.
+
+    Keyword arguments:
+    deltas -- A delta matrix (see delta_matrix).
+    k -- Only return the k closest authors. If None then all authors
+         are ranked. (default None)
+    """
+    ranking = np.argsort(deltas, axis=1, kind='stable')
+    return ranking if k is None else ranking[:, :k]
+
+
+def score_answers(deltas, authors, calibration=None, top=0):
+    """
+    Return the closest author of every row of a delta matrix, its score
+    and, if top is larger than 0, the top closest authors of every row as
+    lists of dictionaries with their name, delta and score. All of them
+    are taken from the same delta matrix, so no text is scored twice.
+
+    Keyword arguments:
+    deltas -- A delta matrix (see delta_matrix).
+    authors -- The names of the authors (columns).
+    calibration -- A calibration.Calibration. If None then every score
+                   is 1. (default None)
+    top -- The number of ranked candidates per row. (default 0)
+    """
+    ranking = rank_candidates(deltas, max(top, 1))
+    if calibration is None:
+        scores = np.ones(deltas.shape, dtype=int)
+    else:
+        scores = calibration.scores(deltas)
+    rows = np.arange(deltas.shape[0])[:, np.newaxis]
+    ranked_deltas = deltas[rows, ranking].tolist()
+    ranked_scores = scores[rows, ranking].tolist()
+    cands = [authors[columns[0]] for columns in ranking]
+    answer_scores = [row[0] for row in ranked_scores]
+    if top <= 0:
+        return cands, answer_scores, None
+    candidates = [[{"author": authors[column], "delta": delta, "score": score}
+                   for column, delta, score in zip(columns, row_deltas,
+                                                   row_scores)]
+                  for columns, row_deltas, row_scores
+                  in zip(ranking, ranked_deltas, ranked_scores)]
+    return cands, answer_scores, candidates
+
+
+def text_deltas(database, texts):
+    """
+    Return the delta matrix of the given texts and all authors of a
+    processed vectorized database whose author zscores are calculated.
+    """
+    query_zscores, query_mask = database.text_zscores(texts)
+    return delta_matrix(query_zscores, database.author_zscores(), query_mask)
+
+
+def closest_authors(database, texts):
+    """
+    Return the closest author of the database for every text.
+    For a vectorized database all texts are scored in one batch,
+    otherwise every text is compared with every author.
+    """
+    if database.vectorized:
+        deltas = text_deltas(database, texts)
+        return [database.authors[i] for i in deltas.argmin(axis=1)]
+    return [database.authors[ranking[0]]
+            for ranking in rank_author_deltas(author_deltas(database, texts),
+                                              1)]
+
+
+def author_deltas(database, texts):
+    """
+    Return for every text the list of its deltas to all authors of a
+    processed database (in the order of database.authors). Every text is
+    compared with every author, i.e. this also works without NumPy.
+    """
+    for text in texts:
+        text.calc_zscores(database)
+    with metrics.timer("delta"):
+        deltas = [[text.calc_delta(database, author)
+                   for author in database.authors]
+                  for text in texts]
+    metrics.count("deltas", len(texts) * len(database.authors))
+    return deltas
+
+
+def rank_author_deltas(deltas, k=None):
+    """
+    Return the indices of the authors of every list of deltas (see
+    author_deltas) ranked by their delta like rank_candidates, i.e. ties
+    are broken by the order of the authors.
+
+    Keyword arguments:
+    deltas -- The lists of the deltas of the texts.
+    k -- Only return the k closest authors. If None then all authors
+         are ranked. (default None)
+    """
+    rankings = [sorted(range(len(row)), key=row.__getitem__) for row in deltas]
+    return rankings if k is None else [ranking[:k] for ranking in rankings]
+
+
+def make_folds(labels, folds):
+    """
+    Assign every text to a fold such that the texts of every author are
+    spread over the folds and return the list of the folds of the texts.
+    If folds is 0 then every text is its own fold (leave-one-out).
+    """
+    if folds == 0:
+        return list(range(len(labels)))
+    offsets = {label: i for i, label in enumerate(dict.fromkeys(labels))}
+    positions = Counter()
+    fold_ids = []
+    for label in labels:
+        fold_ids.append((offsets[label] + positions[label]) % folds)
+        positions[label] += 1
+    return fold_ids
+
+
+def cross_validate(database, texts, correct_authors, lengths, folds=0):
+    """
+    Cross-validate the numbers of considered words without NumPy (see
+    search.search, which does the same with the matrix backend). For every
+    fold, a database of the authors and their texts of the other folds is
+    built of the processed texts, i.e. no text is counted again, and the
+    texts of the fold are attributed. Returns a dictionary which maps
+    every length to the number of correctly attributed texts.
+
+    Keyword arguments:
+    database -- The database of all texts.
+    texts -- The processed texts.
+    correct_authors -- The authors of the texts (of the database).
+    lengths -- The numbers of considered words.
+    folds -- Number of folds (0 for leave-one-out). (default 0)
+    """
+    fold_ids = make_folds([author.name for author in correct_authors], folds)
+    results = dict.fromkeys(lengths, 0)
+    for fold in sorted(set(fold_ids)):
+        held = [i for i, fold_id in enumerate(fold_ids) if fold_id == fold]
+        authors = {author: Author(author.name) for author in database.authors}
+        for i, (text, author) in enumerate(zip(texts, correct_authors)):
+            if fold_ids[i] != fold:
+                authors[author].add_text(text)
+        fold_database = Database(real_words=database.real_words)
+        fold_database.add_author(*authors.values())
+        for length in lengths:
+            logging.info("Check fold %s for %s words.", fold, length)
+            fold_database.considered_words = length
+            fold_database.process()
+            fold_database.calc_zscores()
+            closest = closest_authors(fold_database,
+                                      [texts[i] for i in held])
+            results[length] += sum(
+                author.name == correct_authors[i].name
+                for author, i in zip(closest, held))
+    return results
+
+
+def train(corpus, pos_tag=False, stream=False, jobs=1, cache=None,
+          lengths=range(150, 301, 50), folds=0, calibration="softmax",
+          prefetch_depth=8):
+    """
+    Build the database of the training texts of a corpus and choose the
+    best number of considered words. Returns the processed database whose
+    authors have their zscores calculated.
+
+    For a vectorized database, the calibration of the scores is fitted on
+    the deltas of the held-out texts of the best number of considered
+    words, which the cross-validation has calculated anyway.
+
+    Keyword arguments:
+    corpus -- A corpus.Corpus.
+    pos_tag -- Should the texts be POS tagged? (default False)
+    stream -- See tira. (default False)
+    jobs -- See tira. (default 1)
+    cache -- See tira. (default None)
+    lengths -- The numbers of considered words to choose from.
+               (default range(150, 301, 50))
+    folds -- Number of folds for cross-validating the lengths (0 for
+             leave-one-out). Without NumPy, they are cross-validated by
+             cross_validate. (default 0)
+    calibration -- The method of the calibration of the scores (see
+                   calibration.Calibration) or None. (default "softmax")
+    prefetch_depth -- See load_texts. (default 8)
+    """
     # creating training data
     logging.info("Load the training data...")
-    database = Database(150, real_words=True)
-    for candidate in jsonhandler.candidates:
+    files = [(corpus.training_key(candidate, training),
+              candidate + " " + training)
+             for candidate in corpus.candidates
+             for training in corpus.trainings[candidate]]
+    texts = iter(load_texts(files, pos_tag=pos_tag, stream=stream, jobs=jobs,
+                            cache=cache, corpus=corpus,
+                            prefetch_depth=prefetch_depth))
+    database = Database(150, real_words=True, vectorized=np is not None)
+    for candidate in corpus.candidates:
         author = Author(candidate)
-        for training in jsonhandler.trainings[candidate]:
-            logging.info(
-                "Author '%s': Loading training '%s'", candidate, training)
-            text = Text(jsonhandler.getTrainingText(candidate, training),
-                        candidate + " " + training,
-                        pos_tag=pos_tag)
-            author.add_text(text)
+        for training in corpus.trainings[candidate]:
+            author.add_text(next(texts))
         database.add_author(author)
     database.process()
+    database.calc_zscores()
 
-    for author in database.authors:
-        author.calc_cmsz(database)
-
-    # do some training, i.e. check which parameter is best
+    # do some training, i.e. check which parameter is best.
+    # The training texts have already been processed when the
+    # authors were built, so only their zscores and deltas
+    # depend on the length.
     logging.info("Start training...")
-    results = {}
-    for length in range(150, 301, 50):
-        logging.info("Check for %s words.", length)
-        database.considered_words = length
-        database.process()
-        results[length] = 0
-        for correct_author in database.authors:
-            for training in jsonhandler.trainings[correct_author.name]:
-                trainingcase = Text(
-                    jsonhandler.getTrainingText(correct_author.name, training),
-                    "Trainingcase",
-                    pos_tag=pos_tag)
-                trainingcase.calc_zscores(database)
-                deltas = {}
-                for author in database.authors:
-                    deltas[author] = trainingcase.calc_delta(database, author)
-                if min(deltas, key=deltas.get) == correct_author:
-                    results[length] += 1
-    length = max(results, key=results.get)
+    trainingcases = []
+    correct_authors = []
+    for correct_author in database.authors:
+        for text in correct_author.texts:
+            trainingcases.append(text)
+            correct_authors.append(correct_author)
+
+    if database.vectorized:
+        # cross-validate the lengths (see search.search)
+        import search
+        with metrics.timer("search"):
+            results = search.search({pos_tag: trainingcases},
+                                    [author.name for author in correct_authors],
+                                    considered_words=lengths,
+                                    real_words=(database.real_words,),
+                                    folds=folds, jobs=jobs,
+                                    keep_deltas=calibration is not None)
+        result = search.best(results)
+        length = result["considered_words"]
+        if calibration is not None:
+            from calibration import Calibration
+            columns = {author: i for i, author in enumerate(database.authors)}
+            database.calibration = Calibration.fit(
+                result["deltas"],
+                [columns[author] for author in correct_authors],
+                method=calibration)
+    else:
+        results = cross_validate(database, trainingcases, correct_authors,
+                                 lengths, folds)
+        length = max(results, key=results.get)
     logging.info("Choose %s as length.", str(length))
 
     # reconfigure the database with length
     database.considered_words = length
     database.process()
+    database.calc_zscores()
+    return database
+
+
+def write_comparison(path, texts, authors, results, true_authors=None,
+                     missing="skip"):
+    """
+    Write the answers of several Delta variants side by side as JSON, i.e.
+    the closest author and its delta per variant for every text together
+    with the time and (if the true authors are given) the accuracy of
+    every variant.
+
+    Keyword arguments:
+    path -- Path to the output file.
+    texts -- The names of the texts.
+    authors -- The names of the authors (columns of the delta matrices).
+    results -- A dictionary which maps the name of every variant to its
+               delta matrix and time (see distances.compare).
+    true_authors -- The true authors of the texts or None. (default None)
+    missing -- See distances.compare. (default "skip")
+    """
+    closest = {name: deltas.argmin(axis=1) for name, (deltas, seconds)
+               in results.items()}
+    summary = {}
+    for name, (deltas, seconds) in results.items():
+        summary[name] = {"time": seconds}
+        if true_authors is not None:
+            correct = sum(authors[column] == true_author for column, true_author
+                          in zip(closest[name], true_authors))
+            summary[name]["accuracy"] = correct / len(texts) if texts else 0
+    answers = [{"unknown_text": text,
+                "authors": {name: authors[closest[name][row]]
+                            for name in results},
+                "deltas": {name: float(deltas[row, closest[name][row]])
+                           for name, (deltas, seconds) in results.items()}}
+               for row, text in enumerate(texts)]
+    with open(path, "w") as f:
+        json.dump({"missing": missing, "metrics": summary,
+                   "answers": answers}, f, indent=2)
+
+
+def tira(corpusdir, outputdir, stream=False, jobs=1, cache=None,
+         load_model=None, save_model=None, lengths=range(150, 301, 50),
+         folds=0, calibration="softmax", top=0, chunk_size=0,
+         answers_format="json", prefetch_depth=8, compare_deltas=(),
+         compare_missing="skip"):
+    """
+    Keyword arguments:
+    corpusdir -- Path to a tira corpus or to a packed corpus
+                 (see corpus.Corpus.pack)
+    outputdir -- Output directory
+    stream -- Stream the texts from disk and keep only their counters
+              (see Text.from_file) (default False)
+    jobs -- Number of worker processes for processing the texts
+            (default 1)
+    cache -- A countcache.CountCache for the counters of the texts
+             (default None)
+    load_model -- Path to a model (see model.Model) which is used instead
+                  of training on the corpus (default None)
+    save_model -- Path where the trained model is saved (default None)
+    lengths -- See train (default range(150, 301, 50))
+    folds -- See train (default 0)
+    calibration -- See train (default "softmax")
+    top -- Number of ranked candidates which are written for every
+           unknown text (see score_answers) (default 0)
+    chunk_size -- Number of unknown texts which are loaded and scored at
+                  once. If it is larger than 0, the answers are written
+                  after every chunk with a checkpoint, and a run which
+                  has been interrupted is resumed after the last written
+                  chunk (see answers.AnswerWriter). (default 0)
+    answers_format -- The format of the answers, "json" (answers.json)
+                      or "jsonl" (answers.jsonl, one answer per line)
+                      (default "json")
+    prefetch_depth -- Number of texts which are read ahead while the
+                      previous ones are tokenized (see load_texts)
+                      (default 8)
+    compare_deltas -- Names of Delta variants (see distances.delta_metrics)
+                      which are compared on the unknown texts. Their
+                      answers, timings and (if there is a ground truth)
+                      accuracies are written to comparison.json next to
+                      the answers (see write_comparison) (default ())
+    compare_missing -- See distances.compare (default "skip")
+    """
+    pos_tag = False
+    if compare_deltas and (load_model is not None or chunk_size
+                           or np is None):
+        raise ValueError("Delta variants can only be compared when the "
+                         "unknown texts are scored at once after training "
+                         "with NumPy.")
+    if save_model is not None and np is None:
+        raise ImportError("Saving a model requires NumPy.")
+    if compare_deltas:
+        # Check the names before the training, not after it.
+        import distances
+        for name in compare_deltas:
+            distances.get_metric(name)
+
+    corpus = open_corpus(corpusdir)
+
+    if load_model is not None:
+        from model import Model
+        model = Model.load(load_model)
+        pos_tag = model.pos_tag
+    else:
+        with metrics.timer("train"):
+            database = train(corpus, pos_tag=pos_tag, stream=stream,
+                             jobs=jobs, cache=cache, lengths=lengths,
+                             folds=folds, calibration=calibration,
+                             prefetch_depth=prefetch_depth)
+        if save_model is not None:
+            from model import Model
+            Model.from_database(database, pos_tag=pos_tag).save(save_model)
+
+    def attribute(testcases):
+        if load_model is not None:
+            return score_answers(model.deltas(testcases), model.authors,
+                                 model.calibration, top)
+        if database.vectorized:
+            return score_answers(text_deltas(database, testcases),
+                                 [author.name for author in database.authors],
+                                 database.calibration, top)
+        # Without NumPy there is no calibration, so every score is 1.
+        deltas = author_deltas(database, testcases)
+        rankings = rank_author_deltas(deltas, max(top, 1))
+        cands = [database.authors[ranking[0]].name for ranking in rankings]
+        if top <= 0:
+            return cands, None, None
+        return cands, None, [[{"author": database.authors[i].name,
+                               "delta": row[i], "score": 1}
+                              for i in ranking]
+                             for ranking, row in zip(rankings, deltas)]
 
     # run the testcases
-    results = []
-    for unknown in jsonhandler.unknowns:
-        testcase = Text(jsonhandler.getUnknownText(unknown),
-                        unknown,
-                        pos_tag=pos_tag)
-        testcase.calc_zscores(database)
-        deltas = {}
-        for author in database.authors:
-            deltas[author] = testcase.calc_delta(database, author)
-        results.append((unknown, min(deltas, key=deltas.get).name))
-
-    texts = [text for (text, candidate) in results]
-    cands = [candidate for (text, candidate) in results]
-    jsonhandler.storeJson(outputdir, texts, cands)
+    files = [(corpus.unknown_key(unknown), unknown)
+             for unknown in corpus.unknowns]
+    if chunk_size == 0 and answers_format == "json":
+        testcases = load_texts(files, pos_tag=pos_tag, stream=stream,
+                               jobs=jobs, cache=cache, corpus=corpus,
+                               prefetch_depth=prefetch_depth)
+        texts = [testcase.name for testcase in testcases]
+        cands, scores, candidates = attribute(testcases)
+        with metrics.timer("write"):
+            jsonhandler.storeJson(outputdir, texts, cands, scores, candidates)
+        if compare_deltas:
+            import distances
+            results = distances.compare(database, testcases, compare_deltas,
+                                        compare_missing)
+            write_comparison(os.path.join(outputdir, "comparison.json"),
+                             texts, [author.name for author in database.authors],
+                             results, corpus.true_authors(), compare_missing)
+        return
+
+    # Only one chunk of unknown texts is in memory at a time and the
+    # answers are written (and checkpointed) after every chunk.
+    fname = jsonhandler.OUT_FNAME
+    if answers_format == "jsonl":
+        fname = os.path.splitext(fname)[0] + ".jsonl"
+    writer = AnswerWriter(os.path.join(outputdir, fname), answers_format)
+    chunk_size = chunk_size or max(1, len(files))
+    for start in range(writer.done, len(files), chunk_size):
+        testcases = load_texts(files[start:start + chunk_size],
+                               pos_tag=pos_tag, stream=stream, jobs=jobs,
+                               cache=cache, corpus=corpus,
+                               prefetch_depth=prefetch_depth)
+        cands, scores, candidates = attribute(testcases)
+        with metrics.timer("write"):
+            writer.write(make_answers([testcase.name for testcase in testcases],
+                                      cands, scores, candidates))
+    writer.close()
+
+
+def add_tira_arguments(parser):
+    """
+    Add the options of tira which burrows02.py and batch.py share to an
+    argparse.ArgumentParser (see tira_options).
+    """
+    parser.add_argument('--stream',
+                        action='store_true',
+                        help='Stream the texts and keep only their counters')
+    parser.add_argument('--prefetch',
+                        action='store',
+                        type=int,
+                        default=8,
+                        help='Number of texts which are read ahead while the '
+                             'previous ones are tokenized (0 to read one at '
+                             'a time)')
+    parser.add_argument('--cache',
+                        action='store',
+                        help='Path to a cache of the word counts of the texts')
+    parser.add_argument('--cache-size',
+                        action='store',
+                        type=int,
+                        default=1024,
+                        help='Maximal size of the cache in MiB')
+    parser.add_argument('--load-model',
+                        action='store',
+                        help='Path to a trained model which is used instead '
+                             'of training on the input')
+    parser.add_argument('--considered-words',
+                        action='store',
+                        type=int,
+                        nargs='+',
+                        default=list(range(150, 301, 50)),
+                        help='The numbers of considered words to choose from')
+    parser.add_argument('--folds',
+                        action='store',
+                        type=int,
+                        default=0,
+                        help='Number of folds for choosing the number of '
+                             'considered words (0 for leave-one-out)')
+    parser.add_argument('--calibration',
+                        action='store',
+                        choices=['softmax', 'margin', 'none'],
+                        default='softmax',
+                        help='The method of the calibration of the scores')
+    parser.add_argument('--top',
+                        action='store',
+                        type=int,
+                        default=0,
+                        help='Number of ranked candidates which are written '
+                             'for every unknown text')
+    parser.add_argument('--chunk-size',
+                        action='store',
+                        type=int,
+                        default=0,
+                        help='Number of unknown texts which are scored at '
+                             'once; the answers are written after every chunk '
+                             'and an interrupted run is resumed (0 for all '
+                             'at once)')
+    parser.add_argument('--answers-format',
+                        action='store',
+                        choices=['json', 'jsonl'],
+                        default='json',
+                        help='Write the answers as answers.json or as JSON '
+                             'Lines to answers.jsonl')
+
+
+def tira_options(args):
+    """
+    Return the keyword arguments of tira for the parsed options of
+    add_tira_arguments (as a dictionary, see vars).
+    """
+    cache = None
+    if args['cache']:
+        cache = countcache.CountCache(args['cache'],
+                                      max_size=args['cache_size'] << 20)
+    return {
+        "stream": args['stream'],
+        "cache": cache,
+        "load_model": args['load_model'],
+        "lengths": args['considered_words'],
+        "folds": args['folds'],
+        "calibration": None if args['calibration'] == 'none'
+        else args['calibration'],
+        "top": args['top'],
+        "chunk_size": args['chunk_size'],
+        "answers_format": args['answers_format'],
+        "prefetch_depth": args['prefetch'],
+    }
 
 
 def main():
+    if np is not None:
+        from distances import delta_metrics
+        delta_metrics = sorted(delta_metrics)
+    else:
+        delta_metrics = None
     parser = argparse.ArgumentParser(description='Tira submission for Delta.')
     parser.add_argument('-i',
                         action='store',
-                        help='Path to input directory')
+                        help='Path to input directory (or packed corpus)')
     parser.add_argument('-o',
                         action='store',
                         help='Path to output directory')
+    parser.add_argument('--jobs',
+                        action='store',
+                        type=int,
+                        default=1,
+                        help='Number of worker processes for processing '
+                             'the texts (0 for one per CPU)')
+    parser.add_argument('--save-model',
+                        action='store',
+                        help='Path where the trained model is saved')
+    add_tira_arguments(parser)
+    parser.add_argument('--compare-deltas',
+                        action='store',
+                        nargs='+',
+                        default=[],
+                        choices=delta_metrics,
+                        help='Delta variants (burrows, eder, quadratic, '
+                             'linear, cosine) whose answers are compared in '
+                             'comparison.json')
+    parser.add_argument('--compare-missing',
+                        action='store',
+                        choices=['skip', 'zero'],
+                        default='skip',
+                        help='Compare only the words of every text (skip) or '
+                             'all considered words (zero)')
+    parser.add_argument('--metrics',
+                        action='store',
+                        help='Path where a JSON report of the time spent in '
+                             'every stage is written')
+    parser.add_argument('--profile',
+                        action='store',
+                        help='Path where cProfile statistics of the run are '
+                             'written')
 
     args = vars(parser.parse_args())
 
     corpusdir = args['i']
     outputdir = args['o']
 
-    tira(corpusdir, outputdir)
+    if args['metrics']:
+        metrics.enable()
+    with profile(args['profile']):
+        tira(corpusdir, outputdir, jobs=args['jobs'],
+             save_model=args['save_model'],
+             compare_deltas=args['compare_deltas'],
+             compare_missing=args['compare_missing'],
+             **tira_options(args))
+    if args['metrics']:
+        metrics.write(args['metrics'])
 
 
 if __name__ == "__main__":
@@ -0,0 +1,240 @@
+import logging
+
+import numpy as np
+
+
+METHODS = ("softmax", "margin")
+
+
+class Calibration:
+
+    """
+    Turns the deltas of a text and all authors into calibrated scores, i.e.
+    estimates of the probability that an author is the true author. The
+    parameters are fitted on the deltas of texts with known authors, e.g.
+    the held-out texts of the cross-validation in train.
+
+    There are two methods:
+    softmax -- The scores are a softmax over the negative deltas,
+               exp(-delta / temperature), normalized over the authors. The
+               temperature is fitted by minimizing the negative
+               log-likelihood of the true authors.
+    margin -- The score of an author is a logistic function of its
+              relative margin, (other - delta) / other, where other is the
+              smallest delta of all other authors. The margin of the
+              closest author is positive and the margins of all other
+              authors are negative. The slope and the intercept are fitted
+              by logistic regression on the margins of all authors.
+    """
+
+    def __init__(self, method="softmax", parameters=None):
+        """
+        Initialize a calibration.
+
+        Keyword arguments:
+        method -- "softmax" or "margin" (default "softmax")
+        parameters -- The parameters of the method, i.e. [temperature] or
+                      [slope, intercept]. If None then the scores are not
+                      calibrated (temperature 1, slope 1 and intercept 0).
+                      (default None)
+        """
+        if method not in METHODS:
+            raise ValueError("Unknown calibration method '%s'." % method)
+        self.method = method
+        if parameters is None:
+            parameters = [1.0] if method == "softmax" else [1.0, 0.0]
+        self.parameters = [float(parameter) for parameter in parameters]
+
+    @classmethod
+    def fit(cls, deltas, labels, method="softmax"):
+        """
+        Fit a calibration to a delta matrix (see burrows02.delta_matrix)
+        of texts with known authors.
+
+        Keyword arguments:
+        deltas -- A delta matrix with one row per text.
+        labels -- The column index of the true author of every text.
+        method -- See Calibration. (default "softmax")
+        """
+        deltas = np.asarray(deltas, dtype=float)
+        labels = np.asarray(labels, dtype=np.intp)
+        if method == "softmax":
+            calibration = cls(method, [fit_temperature(deltas, labels)])
+        else:
+            calibration = cls(method, fit_margin(deltas, labels))
+        logging.info("Calibration: Fitted %s with %s on %s texts.", method,
+                     calibration.parameters, len(labels))
+        return calibration
+
+    def scores(self, deltas):
+        """
+        Return the matrix of the scores of every text (row) and every
+        author (column) of a delta matrix.
+        """
+        deltas = np.asarray(deltas, dtype=float)
+        if deltas.shape[1] == 1:
+            return np.ones(deltas.shape)
+        if self.method == "softmax":
+            return softmax(-deltas / self.parameters[0])
+        slope, intercept = self.parameters
+        return logistic(slope * relative_margins(deltas) + intercept)
+
+    def to_dict(self):
+        return {"method": self.method, "parameters": self.parameters}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["method"], data["parameters"])
+
+
+def softmax(matrix):
+    """Return the softmax of every row of a matrix."""
+    exponentials = np.exp(matrix - matrix.max(axis=1, keepdims=True))
+    return exponentials / exponentials.sum(axis=1, keepdims=True)
+
+
+def logistic(matrix):
+    return 0.5 * (1 + np.tanh(0.5 * matrix))
+
+
+def relative_margins(deltas):
+    """
+    Return the relative margin of every author of a delta matrix (see
+    Calibration).
+    """
+    rows = np.arange(deltas.shape[0])
+    closest = deltas.argmin(axis=1)
+    smallest = np.partition(deltas, 1, axis=1)[:, :2]
+    other = np.repeat(smallest[:, :1], deltas.shape[1], axis=1)
+    other[rows, closest] = smallest[:, 1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        margins = (other - deltas) / other
+    return np.where(other > 0, margins, 0)
+
+
+def fit_temperature(deltas, labels, iterations=100):
+    """
+    Return the temperature which minimizes the negative log-likelihood of
+    the true authors under the softmax over the negative deltas.
+
+    The negative log-likelihood is convex in the inverse temperature, so
+    it is minimized by a golden section search. If the training texts are
+    (almost) perfectly separated, the likelihood grows as the temperature
+    goes to 0 and every top score would be 1. Therefore the temperature is
+    raised if needed such that the mean top score of the training texts
+    does not exceed their bound of confidence (see confidence_bound).
+    """
+    if deltas.shape[1] < 2 or len(labels) == 0:
+        return 1.0
+    spread = float(np.median(deltas.std(axis=1)))
+    if spread <= 0:
+        return 1.0
+    true_deltas = deltas[np.arange(len(labels)), labels]
+
+    def loss(beta):
+        logits = -beta * deltas
+        top = logits.max(axis=1)
+        return float(np.mean(
+            top + np.log(np.exp(logits - top[:, np.newaxis]).sum(axis=1))
+            + beta * true_deltas))
+
+    ratio = (np.sqrt(5) - 1) / 2
+    low, high = 1e-3 / spread, 100 / spread
+    a = high - ratio * (high - low)
+    b = low + ratio * (high - low)
+    loss_a, loss_b = loss(a), loss(b)
+    for i in range(iterations):
+        if loss_a <= loss_b:
+            high, b, loss_b = b, a, loss_a
+            a = high - ratio * (high - low)
+            loss_a = loss(a)
+        else:
+            low, a, loss_a = a, b, loss_b
+            b = low + ratio * (high - low)
+            loss_b = loss(b)
+
+    def confidence(beta):
+        return float(softmax(-beta * deltas).max(axis=1).mean())
+
+    beta = limit(confidence, (low + high) / 2,
+                 confidence_bound(deltas, labels))
+    return 1 / beta
+
+
+def fit_margin(deltas, labels):
+    """
+    Return the slope and the intercept of the logistic function of the
+    relative margins (see Calibration), which are fitted by logistic
+    regression on the margins of all texts and authors. As for
+    fit_temperature, the slope is lowered if needed such that the mean top
+    score of the training texts does not exceed their bound of confidence.
+    """
+    margins = relative_margins(deltas)
+    truth = np.zeros(deltas.shape)
+    truth[np.arange(len(labels)), labels] = 1
+    slope, intercept = fit_logistic(margins.ravel(), truth.ravel())
+    if len(labels) == 0:
+        return [slope, intercept]
+    top_margins = margins[np.arange(len(labels)), deltas.argmin(axis=1)]
+
+    def confidence(slope):
+        return float(logistic(slope * top_margins + intercept).mean())
+
+    return [limit(confidence, slope, confidence_bound(deltas, labels)),
+            intercept]
+
+
+def confidence_bound(deltas, labels):
+    """
+    Return the highest mean top score which the training texts support,
+    (correct + 1) / (n + 2) for n texts of which correct are closest to
+    their true author (Laplace's rule of succession). E.g. 24 correctly
+    attributed texts support a mean top score of at most 25 / 26 = 0.96,
+    not 1.
+    """
+    correct = int((deltas.argmin(axis=1) == labels).sum())
+    return (correct + 1) / (len(labels) + 2)
+
+
+def limit(function, high, bound, iterations=100):
+    """
+    Return the largest x in [0, high] with function(x) <= bound (found by
+    bisection) for a function which increases with x. If function(high) is
+    within the bound then high is returned.
+    """
+    if function(high) <= bound:
+        return high
+    low = 0.0
+    for i in range(iterations):
+        middle = (low + high) / 2
+        if function(middle) <= bound:
+            low = middle
+        else:
+            high = middle
+    return low
+
+
+def fit_logistic(x, y, penalty=1e-6, iterations=100):
+    """
+    Return the slope and the intercept of a logistic regression of the
+    binary labels y on x, fitted by Newton's method.
+
+    The slope has a tiny L2 penalty which does not grow with the number of
+    samples, such that it hardly shrinks the slope of data which is not
+    separable but keeps the slope of separable data finite. The intercept
+    is not penalized.
+    """
+    if len(x) == 0:
+        return [1.0, 0.0]
+    features = np.column_stack([x, np.ones(len(x))])
+    weights = np.zeros(2)
+    regularization = np.diag([penalty, 0.0])
+    for i in range(iterations):
+        p = logistic(features @ weights)
+        gradient = features.T @ (p - y) + regularization @ weights
+        hessian = (features.T * (p * (1 - p))) @ features + regularization
+        step = np.linalg.lstsq(hessian, gradient, rcond=None)[0]
+        weights -= step
+        if np.abs(step).max() < 1e-9:
+            break
+    return weights.tolist()
@@ -0,0 +1,258 @@
+import argparse
+import codecs
+import hashlib
+import io
+import json
+import logging
+import mmap
+import os
+import struct
+
+import jsonhandler
+
+
+# A packed corpus starts with MAGIC, which is followed by the contents of
+# all documents, a JSON index and the offset of the index (little-endian
+# unsigned 64-bit integer).
+MAGIC = b"DELTACP1"
+
+
+class Corpus:
+
+    """
+    A corpus in the layout of jsonhandler (a meta-file.json, a directory
+    of training texts per candidate author and a directory of unknown
+    texts).
+
+    Unlike jsonhandler, a corpus is an object: it is indexed once when it
+    is created and several corpora can be used in one process. Documents
+    are addressed by keys of the form "<directory>/<file name>" and are
+    read in one bulk read and decoded with the declared encoding.
+    """
+
+    def __init__(self, path):
+        """
+        Index the corpus in the given directory.
+
+        Keyword arguments:
+        path -- Path to the directory of the corpus.
+        """
+        self.path = path
+        with open(os.path.join(path, jsonhandler.META_FNAME), "r") as f:
+            meta = json.load(f)
+        self.index(meta, self.scan(meta))
+
+    def scan(self, meta):
+        """
+        Return a dictionary which maps every candidate author to the file
+        names of his training texts (in the order of jsonhandler).
+        """
+        trainings = {}
+        for author in meta["candidate-authors"]:
+            candidate = author["author-name"]
+            with os.scandir(os.path.join(self.path, candidate)) as entries:
+                trainings[candidate] = [entry.name for entry in entries
+                                        if entry.is_file()]
+        return trainings
+
+    def index(self, meta, trainings):
+        """Set the index of the corpus from its meta data."""
+        self.meta = meta
+        self.folder = meta["folder"]
+        self.language = meta["language"]
+        # e.g. "UTF8", normalized to the name of the Python codec
+        self.encoding = codecs.lookup(meta["encoding"]).name
+        self.candidates = [author["author-name"]
+                           for author in meta["candidate-authors"]]
+        self.unknowns = [text["unknown-text"] for text in meta["unknown-texts"]]
+        self.trainings = trainings
+
+    def training_key(self, candidate, fname):
+        """Return the key of a training text."""
+        return candidate + "/" + fname
+
+    def unknown_key(self, fname):
+        """Return the key of an unknown text."""
+        return self.folder + "/" + fname
+
+    def keys(self):
+        """Return the keys of all documents."""
+        return [self.training_key(candidate, training)
+                for candidate in self.candidates
+                for training in self.trainings[candidate]] + \
+            [self.unknown_key(unknown) for unknown in self.unknowns]
+
+    def file_path(self, key):
+        return os.path.join(self.path, *key.split("/"))
+
+    def read_bytes(self, key):
+        """Return the content of a document as bytes."""
+        with open(self.file_path(key), "rb") as f:
+            return f.read()
+
+    def read(self, key):
+        """Return the content of a document as a string."""
+        return codecs.decode(self.read_bytes(key), self.encoding)
+
+    def open(self, key):
+        """
+        Open a document as a text stream, e.g. to read it in chunks
+        (see burrows02.read_chunks).
+        """
+        return open(self.file_path(key), "r", encoding=self.encoding,
+                    newline="")
+
+    def digest(self, key):
+        """
+        Return the SHA-256 hex digest of the content of a document
+        (see countcache.file_digest).
+        """
+        return hashlib.sha256(self.read_bytes(key)).hexdigest()
+
+    def true_authors(self):
+        """Return the true authors of the unknown texts (or None)."""
+        try:
+            with open(os.path.join(self.path, jsonhandler.GT_FNAME)) as f:
+                truth = json.load(f)
+        except FileNotFoundError:
+            return None
+        return [text["true-author"] for text in truth["ground-truth"]]
+
+    def pack(self, path):
+        """
+        Write the corpus into one file (see PackedCorpus), such that it
+        can be read without opening a file per document.
+        """
+        offsets = {}
+        with open(path, "wb") as f:
+            f.write(MAGIC)
+            for key in self.keys():
+                data = self.read_bytes(key)
+                offsets[key] = [f.tell(), len(data)]
+                f.write(data)
+            index = f.tell()
+            f.write(json.dumps({
+                "meta": self.meta,
+                "trainings": self.trainings,
+                "ground_truth": self.true_authors(),
+                "offsets": offsets,
+            }, ensure_ascii=False).encode("utf-8"))
+            f.write(struct.pack("<Q", index))
+        logging.info("Corpus: Packed %s documents into '%s'.", len(offsets),
+                     path)
+
+
+class PackedCorpus(Corpus):
+
+    """
+    A corpus which has been packed into one file (see Corpus.pack). The
+    file is memory-mapped, so reading a document is a slice of the map.
+    """
+
+    def __init__(self, path):
+        """
+        Open the packed corpus in the given file.
+
+        Keyword arguments:
+        path -- Path to the file of the corpus.
+        """
+        self.path = path
+        self._map = None
+        data = self.map
+        if data[:len(MAGIC)] != MAGIC:
+            raise ValueError("'%s' is not a packed corpus." % path)
+        index, = struct.unpack("<Q", data[-8:])
+        header = json.loads(data[index:-8].decode("utf-8"))
+        self.offsets = header["offsets"]
+        self.ground_truth = header["ground_truth"]
+        self.index(header["meta"], header["trainings"])
+
+    def __getstate__(self):
+        # An mmap can not be pickled. Worker processes map the packed
+        # file themselves on their first read (see map).
+        state = self.__dict__.copy()
+        state["_map"] = None
+        return state
+
+    @property
+    def map(self):
+        if self._map is None:
+            with open(self.path, "rb") as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map
+
+    def view(self, key):
+        """Return a memoryview of the content of a document."""
+        offset, length = self.offsets[key]
+        return memoryview(self.map)[offset:offset + length]
+
+    def read_bytes(self, key):
+        return bytes(self.view(key))
+
+    def read(self, key):
+        return codecs.decode(self.view(key), self.encoding)
+
+    def open(self, key):
+        offset, length = self.offsets[key]
+        return io.TextIOWrapper(io.BufferedReader(
+            Section(self.map, offset, length)), encoding=self.encoding,
+            newline="")
+
+    def digest(self, key):
+        return hashlib.sha256(self.view(key)).hexdigest()
+
+    def true_authors(self):
+        return self.ground_truth
+
+
+class Section(io.RawIOBase):
+
+    """A raw binary stream of a part of a memory map."""
+
+    def __init__(self, data, offset, length):
+        self.data = data
+        self.position = offset
+        self.end = offset + length
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = min(len(buffer), self.end - self.position)
+        buffer[:size] = self.data[self.position:self.position + size]
+        self.position += size
+        return size
+
+
+def open_corpus(path):
+    """
+    Open the corpus at the given path, i.e. a PackedCorpus if it is a file
+    and a Corpus if it is a directory.
+    """
+    if os.path.isfile(path):
+        return PackedCorpus(path)
+    return Corpus(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Pack a corpus into one file.')
+    parser.add_argument('-i',
+                        action='store',
+                        required=True,
+                        help='Path to input directory')
+    parser.add_argument('-o',
+                        action='store',
+                        required=True,
+                        help='Path to the packed corpus')
+
+    args = vars(parser.parse_args())
+
+    Corpus(args['i']).pack(args['o'])
+
+
+if __name__ == "__main__":
+    # execute only if run as a script
+    logging.basicConfig(level=logging.ERROR,
+                        format='%(asctime)s %(levelname)s: %(message)s')
+    main()
@@ -0,0 +1,184 @@
+import codecs
+import hashlib
+import json
+import logging
+import sqlite3
+import time
+import zlib
+from collections import Counter
+
+
+# Bump this whenever the tokenization changes such that
+# counters of older versions are not used anymore.
+VERSION = 1
+
+
+def file_digest(path, block_size=1 << 20):
+    """Return the SHA-256 hex digest of the content of a file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class CountCache:
+
+    """
+    A persistent cache of the counters of texts.
+
+    The counters are stored compressed in a SQLite database and are
+    keyed by the hash of the content of a text, its encoding and the
+    tokenizer settings. If the total size of the stored counters exceeds max_size
+    the least recently used counters are evicted.
+    """
+
+    def __init__(self, path, max_size=1 << 30):
+        """
+        Initialize a cache.
+
+        Keyword arguments:
+        path -- Path to the database file. It is created if necessary.
+        max_size -- Maximal number of bytes of all stored counters.
+                    (default 1 GiB)
+        """
+        self.path = path
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._connection = None
+
+    def __getstate__(self):
+        # A SQLite connection must not be shared between processes, so
+        # every worker opens its own connection to the database file.
+        state = self.__dict__.copy()
+        state["_connection"] = None
+        return state
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, timeout=60)
+            # With a write-ahead log several processes (e.g. the workers of
+            # batch.py) can read the cache while one of them writes, and a
+            # commit does not have to wait for the disk.
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            with self._connection:
+                self._connection.execute(
+                    "CREATE TABLE IF NOT EXISTS counters "
+                    "(key TEXT PRIMARY KEY, data BLOB, size INTEGER, used REAL)")
+                self._connection.execute(
+                    "CREATE INDEX IF NOT EXISTS counters_used ON counters (used)")
+                self._connection.execute(
+                    "CREATE TABLE IF NOT EXISTS total (size INTEGER)")
+                if self._connection.execute(
+                        "SELECT COUNT(*) FROM total").fetchone()[0] == 0:
+                    self._connection.execute("INSERT INTO total VALUES (0)")
+        return self._connection
+
+    @staticmethod
+    def key(digest, pos_tag, encoding="utf-8"):
+        """
+        Return the key of a text with the given content hash (see
+        file_digest) which is decoded with the given encoding and
+        tokenized with the given pos_tag setting or, if pos_tag is a
+        string, with the tokenizer of this name (see tokenizer.Tokenizer).
+        """
+        encoding = codecs.lookup(encoding).name
+        if isinstance(pos_tag, str):
+            return "%s:%d:%s:%s" % (digest, VERSION, encoding, pos_tag)
+        return "%s:%d:%s:%d" % (digest, VERSION, encoding, bool(pos_tag))
+
+    def get(self, key):
+        """Return the cached counter of the key or None."""
+        row = self.connection.execute(
+            "SELECT data FROM counters WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        with self.connection:
+            self.connection.execute(
+                "UPDATE counters SET used = ? WHERE key = ?", (time.time(), key))
+        return decode(row[0])
+
+    def transaction(self):
+        """
+        Begin a write transaction and return the connection, which commits
+        it when it is used as a context manager. The database is locked
+        right away (BEGIN IMMEDIATE), such that the total size which is read
+        in the transaction can not be changed by another process before it
+        is written back.
+        """
+        self.connection.execute("BEGIN IMMEDIATE")
+        return self.connection
+
+    def put(self, key, counter):
+        """Store the counter of the key and evict old counters if needed."""
+        data = encode(counter)
+        with self.transaction():
+            row = self.connection.execute(
+                "SELECT size FROM counters WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self.connection.execute(
+                    "UPDATE total SET size = size - ?", (row[0],))
+            self.connection.execute(
+                "INSERT OR REPLACE INTO counters VALUES (?, ?, ?, ?)",
+                (key, data, len(data), time.time()))
+            self.connection.execute(
+                "UPDATE total SET size = size + ?", (len(data),))
+        self.evict()
+
+    def size(self):
+        """Return the number of bytes of all stored counters."""
+        return self.connection.execute("SELECT size FROM total").fetchone()[0]
+
+    def evict(self):
+        """Evict the least recently used counters until max_size is met."""
+        with self.transaction():
+            size = self.size()
+            if size <= self.max_size:
+                return
+            # The oldest counters are read in small batches, such that
+            # only as many rows are read as have to be evicted.
+            evicted = 0
+            while size > self.max_size:
+                rows = self.connection.execute(
+                    "SELECT key, size FROM counters ORDER BY used LIMIT 64"
+                ).fetchall()
+                if not rows:
+                    break
+                for key, data_size in rows:
+                    if size <= self.max_size:
+                        break
+                    cursor = self.connection.execute(
+                        "DELETE FROM counters WHERE key = ?", (key,))
+                    # Only a counter which is actually deleted is
+                    # subtracted from the total.
+                    if cursor.rowcount == 1:
+                        self.connection.execute(
+                            "UPDATE total SET size = size - ?", (data_size,))
+                        size -= data_size
+                        evicted += 1
+        logging.info("Cache '%s': Evicted %s counters.", self.path, evicted)
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+def encode(counter):
+    """
+    Encode a counter as compressed JSON. Tokens are either strings or
+    (word, tag) tuples which are stored as lists.
+    """
+    return zlib.compress(json.dumps(list(counter.items()),
+                                    ensure_ascii=False).encode("utf-8"))
+
+
+def decode(data):
+    """Decode a counter which has been encoded with encode."""
+    return Counter({tuple(token) if isinstance(token, list) else token: count
+                    for token, count in json.loads(zlib.decompress(data).decode("utf-8"))})
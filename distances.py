@@ -0,0 +1,187 @@
+import time
+
+import numpy as np
+
+from burrows02 import delta_matrix, frequency_matrix
+from instrumentation import metrics
+
+
+class DeltaMetric:
+
+    """
+    A variant of Delta, i.e. a distance between the zscore vectors of query
+    texts and authors. All variants work on the same zscore matrices (see
+    burrows02.Database.text_zscores and author_zscores), so several of
+    them can be compared without standardizing the texts again.
+
+    A metric has to implement deltas. It can override prepare if it needs
+    parameters of the words which are not in the zscores.
+    """
+
+    name = None
+
+    def prepare(self, database):
+        """
+        Precompute the parameters of this metric from a processed
+        vectorized database whose author zscores are calculated.
+        """
+
+    def deltas(self, query_zscores, author_zscores, query_mask=None):
+        """
+        Return the delta matrix of the query texts (rows) and the authors
+        (columns).
+
+        Keyword arguments:
+        query_zscores -- The zscore matrix of the query texts.
+        author_zscores -- The zscore matrix of the authors.
+        query_mask -- A boolean matrix which marks the words that are
+                      considered for the respective query text. If None
+                      then all words are considered. (default None)
+        """
+        raise NotImplementedError
+
+
+class BurrowsDelta(DeltaMetric):
+
+    """Burrows' Delta, the Manhattan distance of the zscores."""
+
+    name = "burrows"
+
+    def deltas(self, query_zscores, author_zscores, query_mask=None):
+        return delta_matrix(query_zscores, author_zscores, query_mask)
+
+
+class EderDelta(DeltaMetric):
+
+    """
+    Eder's Delta, the Manhattan distance of the zscores in which the
+    difference of the i-th most common of n words is weighted with
+    (n - i + 1) / n.
+    """
+
+    name = "eder"
+
+    def deltas(self, query_zscores, author_zscores, query_mask=None):
+        words = query_zscores.shape[1]
+        weights = np.arange(words, 0, -1) / max(words, 1)
+        return delta_matrix(query_zscores * weights, author_zscores * weights,
+                            query_mask)
+
+
+class QuadraticDelta(DeltaMetric):
+
+    """
+    Argamon's quadratic Delta, the squared Euclidean distance of the
+    zscores. It is expanded into matrix products, so no intermediate
+    matrix of all texts, authors and words is needed.
+    """
+
+    name = "quadratic"
+
+    def deltas(self, query_zscores, author_zscores, query_mask=None):
+        if query_mask is None:
+            query_mask = np.ones(query_zscores.shape)
+        squares = (query_zscores ** 2 * query_mask).sum(axis=1)
+        return np.maximum(squares[:, np.newaxis]
+                          - 2 * (query_zscores * query_mask) @ author_zscores.T
+                          + query_mask @ (author_zscores ** 2).T, 0)
+
+
+class LinearDelta(DeltaMetric):
+
+    """
+    Argamon's linear Delta, the Manhattan distance of the frequencies
+    divided by the scale of a Laplace distribution (the mean absolute
+    deviation from the median) instead of the standard deviation. It is
+    calculated from the zscores by weighting the difference of every word
+    with its standard deviation divided by its Laplace scale, which is
+    estimated from the training texts of the database.
+    """
+
+    name = "linear"
+
+    def __init__(self):
+        self.weights = None
+
+    def prepare(self, database):
+        texts = [text for author in database.authors for text in author.texts]
+        frequencies = frequency_matrix(texts, database.columns)
+        scales = np.abs(frequencies - np.median(frequencies, axis=0)) \
+            .mean(axis=0)
+        self.weights = np.where(scales > 0, database.stdev_vector
+                                / np.where(scales > 0, scales, 1), 0)
+
+    def deltas(self, query_zscores, author_zscores, query_mask=None):
+        if self.weights is None:
+            raise ValueError("The linear delta has to be prepared with the "
+                             "database of the training texts.")
+        return delta_matrix(query_zscores * self.weights,
+                            author_zscores * self.weights, query_mask)
+
+
+class CosineDelta(DeltaMetric):
+
+    """
+    Cosine Delta (Smith and Aldridge), one minus the cosine similarity of
+    the zscore vectors. With a mask, the author vectors are restricted to
+    the words of the respective query text.
+    """
+
+    name = "cosine"
+
+    def deltas(self, query_zscores, author_zscores, query_mask=None):
+        if query_mask is None:
+            query_mask = np.ones(query_zscores.shape)
+        query_zscores = query_zscores * query_mask
+        products = query_zscores @ author_zscores.T
+        norms = np.sqrt((query_zscores ** 2).sum(axis=1))[:, np.newaxis] \
+            * np.sqrt(query_mask @ (author_zscores ** 2).T)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            similarities = np.where(norms > 0, products / norms, 0)
+        return 1 - similarities
+
+
+# The available metrics by their names.
+delta_metrics = {metric.name: metric for metric in
+                 (BurrowsDelta, EderDelta, QuadraticDelta, LinearDelta,
+                  CosineDelta)}
+
+
+def get_metric(name):
+    """Return a new metric of the given name (see delta_metrics)."""
+    try:
+        return delta_metrics[name]()
+    except KeyError:
+        raise ValueError("Unknown delta metric '%s'." % name) from None
+
+
+def compare(database, texts, names, missing="skip"):
+    """
+    Score the given texts with several metrics in one pass: the zscores of
+    the texts and the authors are calculated once and shared by all
+    metrics. Returns a dictionary which maps the name of every metric to
+    its delta matrix and the time it took in seconds.
+
+    Keyword arguments:
+    database -- A processed vectorized database whose author zscores are
+                calculated.
+    texts -- A list of processed texts.
+    names -- The names of the metrics (see delta_metrics).
+    missing -- "skip" to compare only the words which occur in the
+               respective text (as Text.calc_delta does) or "zero" to
+               compare all considered words, i.e. the words which do not
+               occur in a text or an author have a frequency of 0.
+               (default "skip")
+    """
+    full = missing == "zero"
+    query_zscores, query_mask = database.text_zscores(texts, full=full)
+    author_zscores = database.author_zscores(full=full)
+    results = {}
+    for name in names:
+        metric = get_metric(name)
+        with metrics.timer("delta:" + name):
+            start = time.perf_counter()
+            metric.prepare(database)
+            deltas = metric.deltas(query_zscores, author_zscores, query_mask)
+            results[name] = (deltas, time.perf_counter() - start)
+    return results
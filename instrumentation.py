@@ -0,0 +1,175 @@
+import cProfile
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Metrics:
+
+    """
+    Timers and counters of the stages of a run (tokenization, counting,
+    mean and stdev, zscores, delta, I/O, ...).
+
+    Metrics are disabled by default. Then timer returns a shared no-op
+    context manager and count returns immediately, so instrumented code
+    costs a method call per use. Instrumentation is therefore only placed
+    around whole stages or whole texts, never in the inner loops.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        # Timers and counters may be updated by several threads (see
+        # burrows02.prefetch).
+        self.lock = threading.Lock()
+        self.timers = {}    # name -> [number of calls, seconds]
+        self.counters = {}  # name -> count
+        self.start = None   # time of enable
+
+    def __getstate__(self):
+        # The lock can not be pickled, so a pickled copy of the metrics
+        # gets a new one.
+        state = self.__dict__.copy()
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def enable(self):
+        """Enable and reset the metrics."""
+        self.reset()
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        self.timers = {}
+        self.counters = {}
+        self.start = time.perf_counter()
+
+    def timer(self, name):
+        """
+        Return a context manager which adds the time spent in its body
+        to the timer of the given name.
+        """
+        if not self.enabled:
+            return NULL_TIMER
+        return Timer(self, name)
+
+    def add_time(self, name, seconds, calls=1):
+        """Add the given time to the timer of the given name."""
+        if self.enabled:
+            with self.lock:
+                timer = self.timers.get(name)
+                if timer is None:
+                    self.timers[name] = [calls, seconds]
+                else:
+                    timer[0] += calls
+                    timer[1] += seconds
+
+    def count(self, name, n=1):
+        """Add n to the counter of the given name."""
+        if self.enabled:
+            with self.lock:
+                self.counters[name] = self.counters.get(name, 0) + n
+
+    def report(self):
+        """
+        Return the metrics as a dictionary of the form
+        {"wall_time": 1.2, "timers": {"tokenize": {"calls": 10,
+        "time": 0.5}, ...}, "counters": {"tokens": 12345, ...}}.
+        """
+        return {
+            "wall_time": time.perf_counter() - self.start
+            if self.start is not None else 0,
+            "timers": {name: {"calls": calls, "time": seconds}
+                       for name, (calls, seconds) in self.timers.items()},
+            "counters": dict(self.counters),
+        }
+
+    def merge(self, report):
+        """
+        Add the timers and counters of a report (see report), e.g. of a
+        worker process.
+        """
+        for name, timer in report["timers"].items():
+            self.add_time(name, timer["time"], timer["calls"])
+        for name, n in report["counters"].items():
+            self.count(name, n)
+
+    def write(self, path):
+        """Write the report (see report) to the given path as JSON."""
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=2)
+        logging.info("Metrics: Written to '%s'.", path)
+
+
+class Timer:
+
+    """A context manager which measures the time of its body."""
+
+    __slots__ = ("metrics", "name", "start")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.add_time(self.name, time.perf_counter() - self.start)
+
+
+class NullTimer:
+
+    """A context manager which does nothing (see Metrics.timer)."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+NULL_TIMER = NullTimer()
+
+
+@contextmanager
+def profile(path):
+    """
+    Profile the body with cProfile and dump the statistics to the given
+    path (see pstats). If path is None then nothing is profiled.
+    """
+    if path is None:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+        logging.info("Profile: Written to '%s'.", path)
+
+
+# The metrics of this process.
+metrics = Metrics()
+
+
+def enable():
+    """
+    Enable the metrics of this process. Unlike metrics.enable, this can be
+    the initializer of a process pool with any start method: the function
+    is pickled by name, so it enables the module-level metrics of the
+    worker and not a pickled copy of those of the parent.
+    """
+    metrics.enable()
@@ -130,15 +130,19 @@ def getUnknownBytes(fname):
 # pass a list of filenames (you can use 'unknowns'), a list of your
 # predicted authors and optionally a list of the scores (both must of
 # course be in the same order as the 'texts' list)
+# and a list of the ranked candidates of every text (e.g.
+# [{"author": "candidate1", "delta": 1.2, "score": 0.9}, ...])
 
 
-def storeJson(path, texts, cands, scores=None):
+def storeJson(path, texts, cands, scores=None, candidates=None):
     answers = []
     if scores == None:
         scores = [1 for text in texts]
     for i in range(len(texts)):
         answers.append(
             {"unknown_text": texts[i], "author": cands[i], "score": scores[i]})
+        if candidates != None:
+            answers[i]["candidates"] = candidates[i]
     f = open(os.path.join(path, OUT_FNAME), "w")
     json.dump({"answers": answers}, f, indent=2)
     f.close()
@@ -0,0 +1,195 @@
+import json
+import logging
+import os
+import struct
+
+import numpy as np
+
+from burrows02 import delta_matrix, rank_candidates, vocabulary, zscore_matrix
+
+
+# A model file starts with MAGIC and the length of the JSON header
+# (little-endian unsigned 64-bit integer). The header is followed by
+# the mean frequencies, the standard deviations and the author zscores
+# as little-endian doubles, each of them aligned to 8 bytes such that
+# they can be memory-mapped.
+MAGIC = b"DELTAMD1"
+DTYPE = np.dtype("<f8")
+
+
+class Model:
+
+    """
+    A trained model, i.e. everything of a database and its authors that
+    is needed to attribute texts: the considered words (in the order of
+    their ranking), their mean frequencies and standard deviations and
+    the zscores of all authors.
+    """
+
+    def __init__(self, words, counts, mean, stdev, authors, zscores,
+                 considered_words=0, real_words=False, pos_tag=True,
+                 calibration=None):
+        """
+        Initialize a model.
+
+        Keyword arguments:
+        words -- The considered words in the order of their ranking.
+        counts -- The number of occurrences of the words.
+        mean -- The vector of the mean frequencies of the words.
+        stdev -- The vector of the standard deviations of the words.
+        authors -- The names of the authors.
+        zscores -- The zscore matrix of the authors (one row per author).
+        considered_words -- See Database. (default 0)
+        real_words -- See Database. (default False)
+        pos_tag -- Are the texts POS tagged? (default True)
+        calibration -- A calibration.Calibration of the scores.
+                       (default None)
+        """
+        self.words = words
+        self.columns = {vocabulary.id(word): i for i, word in enumerate(words)}
+        self.counts = counts
+        self.mean = mean
+        self.stdev = stdev
+        self.authors = authors
+        self.zscores = zscores
+        self.considered_words = considered_words
+        self.real_words = real_words
+        self.pos_tag = pos_tag
+        self.calibration = calibration
+
+        # An optional authorindex.AuthorIndex of the author zscores
+        # (see build_index).
+        self.index = None
+
+    @classmethod
+    def from_database(cls, database, pos_tag=True):
+        """
+        Create a model of a processed vectorized database. The zscores of
+        all authors have to be calculated before.
+        """
+        return cls(list(database.words),
+                   [database.counter[word] for word in database.words],
+                   database.mean_vector.copy(),
+                   database.stdev_vector.copy(),
+                   [author.name for author in database.authors],
+                   database.author_zscores(),
+                   considered_words=database.considered_words,
+                   real_words=database.real_words,
+                   pos_tag=pos_tag,
+                   calibration=database.calibration)
+
+    def deltas(self, texts):
+        """
+        Return the delta matrix of the given processed texts and
+        all authors (see burrows02.delta_matrix).
+        """
+        zscores, mask = zscore_matrix(texts, self.columns, self.mean,
+                                      self.stdev)
+        return delta_matrix(zscores, self.zscores, mask)
+
+    def build_index(self, leaf_size=32):
+        """
+        Build an index of the authors such that attribute does not have to
+        compare every text with every author (see authorindex.AuthorIndex).
+        It is only used if k is given. This pays off for very large sets of
+        authors: on the synthetic data of authorindex.benchmark (150 words,
+        k=10), a query takes about as long as the brute-force scan at 16000
+        authors, half as long at 32000 and a third at 64000, but is slower
+        for fewer authors.
+        """
+        from authorindex import AuthorIndex
+        self.index = AuthorIndex(self.zscores, leaf_size=leaf_size)
+
+    def attribute(self, texts, k=1):
+        """
+        Return the k closest authors of every text as a list of
+        (author, delta) tuples. If k is None then all authors are ranked.
+        """
+        if self.index is not None and k is not None:
+            zscores, mask = zscore_matrix(texts, self.columns, self.mean,
+                                          self.stdev)
+            rows, deltas = self.index.query_matrix(zscores, mask, k)
+            return [[(self.authors[row], float(delta))
+                     for row, delta in zip(text_rows, text_deltas)]
+                    for text_rows, text_deltas in zip(rows, deltas)]
+
+        deltas = self.deltas(texts)
+        ranking = rank_candidates(deltas, k)
+        return [[(self.authors[column], float(deltas[row, column]))
+                 for column in columns]
+                for row, columns in enumerate(ranking)]
+
+    def save(self, path):
+        """
+        Save the model to the given path. It is written to a temporary
+        file first and then renamed, such that a model which is loaded
+        (or memory-mapped) by another process is never partially written.
+        """
+        arrays = [self.mean, self.stdev, self.zscores]
+        header = {
+            "words": self.words,
+            "counts": self.counts,
+            "authors": self.authors,
+            "considered_words": self.considered_words,
+            "real_words": self.real_words,
+            "pos_tag": self.pos_tag,
+            "calibration": self.calibration.to_dict()
+            if self.calibration is not None else None,
+            "shapes": [list(np.shape(array)) for array in arrays],
+        }
+        data = json.dumps(header, ensure_ascii=False).encode("utf-8")
+        data += b" " * (-(len(MAGIC) + 8 + len(data)) % DTYPE.itemsize)
+        temporary = path + ".tmp"
+        with open(temporary, "wb") as f:
+            f.write(MAGIC)
+            f.write(struct.pack("<Q", len(data)))
+            f.write(data)
+            for array in arrays:
+                f.write(np.ascontiguousarray(array, dtype=DTYPE).tobytes())
+        os.replace(temporary, path)
+        logging.info("Model: Saved %s words and %s authors to '%s'.",
+                     len(self.words), len(self.authors), path)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Load a model from the given path.
+
+        Keyword arguments:
+        path -- Path to the model file.
+        mmap -- Memory-map the vectors and matrices of the model instead
+                of reading them. (default True)
+        """
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError("'%s' is not a model file." % path)
+            length, = struct.unpack("<Q", f.read(8))
+            header = json.loads(f.read(length).decode("utf-8"))
+            offset = f.tell()
+            arrays = []
+            for shape in header["shapes"]:
+                count = int(np.prod(shape))
+                if mmap and count > 0:
+                    array = np.memmap(path, dtype=DTYPE, mode="r",
+                                      offset=offset, shape=tuple(shape))
+                else:
+                    array = np.fromfile(f, dtype=DTYPE, count=count)
+                    array = array.reshape(shape)
+                offset += count * DTYPE.itemsize
+                f.seek(offset)
+                arrays.append(array)
+
+        # JSON has no tuples, so (word, tag) tokens are stored as lists.
+        words = [tuple(word) if isinstance(word, list) else word
+                 for word in header["words"]]
+        mean, stdev, zscores = arrays
+        calibration = None
+        if header.get("calibration") is not None:
+            from calibration import Calibration
+            calibration = Calibration.from_dict(header["calibration"])
+        return cls(words, header["counts"], mean, stdev, header["authors"],
+                   zscores,
+                   considered_words=header["considered_words"],
+                   real_words=header["real_words"],
+                   pos_tag=header["pos_tag"],
+                   calibration=calibration)
@@ -0,0 +1,331 @@
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+
+import numpy as np
+
+import burrows02
+from burrows02 import delta_matrix, is_real_word, load_texts, standardize
+from corpus import open_corpus
+
+
+# The shared data of the search (see prepare), one entry per pos_tag
+# setting. Worker processes get it once through their initializer.
+_shared = {}
+
+
+def make_folds(labels, folds):
+    """
+    Assign every text to a fold (see burrows02.make_folds) and return the
+    folds of the texts as an array.
+    """
+    return np.array(burrows02.make_folds(labels, folds), dtype=np.intp)
+
+
+def fold_ranking(ranking, counters, order, first, held, max_words):
+    """
+    Return the max_words most common words of the texts which are not held
+    out, with ties broken like Database.calc_counter, i.e. by the first
+    occurrence of the words.
+
+    Keyword arguments:
+    ranking -- The words of all texts and their counts, sorted by their
+               count and their first occurrence.
+    counters -- The counters of the texts.
+    order -- The text indices in the order of their authors.
+    first -- The first occurrence of every word as a tuple (position in
+             order, position in the counter of this text).
+    held -- The indices of the held-out texts.
+    max_words -- The number of words (0 for all).
+    """
+    held_counter = Counter()
+    for i in held:
+        held_counter.update(counters[i])
+
+    def occurrence(word):
+        position = first[word]
+        if order[position[0]] not in held:
+            return position
+        for k in range(position[0] + 1, len(order)):
+            if order[k] not in held and word in counters[order[k]]:
+                return k, list(counters[order[k]]).index(word)
+
+    # Only the words of the held-out texts can move down, so it suffices
+    # to look at the first max_words + len(held_counter) words.
+    if max_words:
+        ranking = ranking[:max_words + len(held_counter)]
+    counts = []
+    for word, count in ranking:
+        count -= held_counter[word]
+        if count > 0:
+            counts.append((word, count, occurrence(word)))
+    counts.sort(key=lambda item: (-item[1], item[2]))
+    words = [word for word, count, position in counts]
+    return words[:max_words] if max_words else words
+
+
+def prepare(counters, labels, folds, max_words, real_words):
+    """
+    Precompute everything the evaluation of the grid points needs for one
+    pos_tag setting: the folds, the ranking of every fold, the frequency
+    matrix of all texts restricted to the ranked words and the sums of the
+    frequencies, of their squares and of the word occurrences per author.
+
+    Keyword arguments:
+    counters -- The counters of the texts.
+    labels -- The authors of the texts.
+    folds -- Number of folds (0 for leave-one-out).
+    max_words -- The largest number of considered words (0 for all).
+    real_words -- The real_words settings of the grid.
+    """
+    fold_ids = make_folds(labels, folds)
+    authors = list(dict.fromkeys(labels))
+    label_ids = np.array([authors.index(label) for label in labels],
+                         dtype=np.intp)
+
+    # A database counts the texts author by author.
+    order = sorted(range(len(counters)), key=lambda i: label_ids[i])
+    total = Counter()
+    first = {}
+    for k, i in enumerate(order):
+        for position, word in enumerate(counters[i]):
+            if word not in first:
+                first[word] = (k, position)
+        total.update(counters[i])
+
+    rankings = {}
+    for real in real_words:
+        ranking = [(word, count) for word, count in total.most_common()
+                   if not real or is_real_word(word)]
+        for fold in range(fold_ids.max() + 1):
+            held = set(np.flatnonzero(fold_ids == fold).tolist())
+            rankings[real, fold] = fold_ranking(ranking, counters, order,
+                                                first, held, max_words)
+
+    words = list(dict.fromkeys(word for ranking in rankings.values()
+                               for word in ranking))
+    index = {word: i for i, word in enumerate(words)}
+    scores = np.zeros((len(counters), len(words)))
+    for row, counter in enumerate(counters):
+        size = sum(counter.values())
+        for word, count in counter.items():
+            column = index.get(word)
+            if column is not None:
+                scores[row, column] = count / size
+
+    author_sums = np.zeros((len(authors), len(words)))
+    np.add.at(author_sums, label_ids, scores)
+    author_texts = np.zeros((len(authors), len(words)), dtype=np.intp)
+    np.add.at(author_texts, label_ids, scores > 0)
+    return {
+        "fold_ids": fold_ids,
+        "rankings": rankings,
+        "index": index,
+        "scores": scores,
+        "sums": scores.sum(axis=0),
+        "squares": (scores ** 2).sum(axis=0),
+        "texts": (scores > 0).sum(axis=0),
+        "label_ids": label_ids,
+        "author_sums": author_sums,
+        "author_texts": author_texts,
+        "author_sizes": np.bincount(label_ids, minlength=len(authors)),
+    }
+
+
+def evaluate(pos_tag, real_words, considered_words, keep_deltas=False):
+    """
+    Evaluate a grid point by cross-validation. For every fold the
+    database and the authors are built of the texts of the other folds
+    (by subtracting the held-out texts from the precomputed sums) and the
+    held-out texts are attributed. Returns a dictionary with the accuracy
+    and the wall time and, if keep_deltas is True, the delta matrix of
+    all held-out texts (e.g. to fit a calibration.Calibration).
+    """
+    shared = _shared[pos_tag]
+    start = time.perf_counter()
+    fold_ids = shared["fold_ids"]
+    label_ids = shared["label_ids"]
+    authors = len(shared["author_sizes"])
+    correct = 0
+    all_deltas = np.empty((len(fold_ids), authors)) if keep_deltas else None
+    for fold in range(fold_ids.max() + 1):
+        ranking = shared["rankings"][real_words, fold]
+        if considered_words > 0:
+            ranking = ranking[:considered_words]
+        columns = np.fromiter((shared["index"][word] for word in ranking),
+                              dtype=np.intp, count=len(ranking))
+        test = np.flatnonzero(fold_ids == fold)
+        held = shared["scores"][np.ix_(test, columns)]
+        present = held > 0
+
+        # the database of the training texts
+        size = len(fold_ids) - len(test)
+        texts = shared["texts"][columns] - present.sum(axis=0)
+        sums = shared["sums"][columns] - held.sum(axis=0)
+        squares = shared["squares"][columns] - (held ** 2).sum(axis=0)
+        means = np.where(texts > 0, sums / max(size, 1), 0)
+        stdevs = np.zeros(len(columns))
+        if size > 1:
+            variances = (squares - size * means ** 2) / (size - 1)
+            stdevs = np.sqrt(np.maximum(variances, 0))
+            stdevs[texts == 0] = 0
+
+        # the authors of the training texts
+        author_sums = np.zeros((authors, len(columns)))
+        np.add.at(author_sums, label_ids[test], held)
+        author_texts = np.zeros((authors, len(columns)), dtype=np.intp)
+        np.add.at(author_texts, label_ids[test], present)
+        author_sizes = shared["author_sizes"] - np.bincount(label_ids[test],
+                                                            minlength=authors)
+        author_present = shared["author_texts"][:, columns] - author_texts > 0
+        author_means = (shared["author_sums"][:, columns] - author_sums) \
+            / np.maximum(author_sizes, 1)[:, np.newaxis]
+        author_zscores = np.where(author_present & (stdevs != 0),
+                                  (author_means - means)
+                                  / np.where(stdevs != 0, stdevs, 1), 0)
+
+        zscores, mask = standardize(held, means, stdevs)
+        deltas = delta_matrix(zscores, author_zscores, mask)
+        correct += int((deltas.argmin(axis=1) == label_ids[test]).sum())
+        if keep_deltas:
+            all_deltas[test] = deltas
+
+    result = {
+        "pos_tag": pos_tag,
+        "real_words": real_words,
+        "considered_words": considered_words,
+        "correct": correct,
+        "texts": len(fold_ids),
+        "accuracy": correct / len(fold_ids) if len(fold_ids) else 0,
+        "time": time.perf_counter() - start,
+    }
+    if keep_deltas:
+        result["deltas"] = all_deltas
+    return result
+
+
+def _initialize(shared):
+    global _shared
+    _shared = shared
+
+
+def _evaluate(args):
+    return evaluate(*args)
+
+
+def search(texts, labels, considered_words=(150, 200, 250, 300),
+           real_words=(True,), folds=0, jobs=1, keep_deltas=False):
+    """
+    Cross-validate every combination of the given settings and return the
+    results (see evaluate) in the order of the grid.
+
+    Keyword arguments:
+    texts -- A dictionary which maps every pos_tag setting of the grid to
+             the list of the processed texts of this setting.
+    labels -- The authors of the texts (in the same order).
+    considered_words -- The considered_words settings.
+                        (default (150, 200, 250, 300))
+    real_words -- The real_words settings. (default (True,))
+    folds -- Number of folds. If 0 then leave-one-out. (default 0)
+    jobs -- Number of worker processes for evaluating the grid points.
+            If 0 then one process per CPU is used. (default 1)
+    keep_deltas -- Keep the delta matrices of the held-out texts in the
+                   results (see evaluate). (default False)
+    """
+    max_words = 0 if 0 in considered_words else max(considered_words)
+    shared = {pos_tag: prepare([text.counter for text in pos_texts], labels,
+                               folds, max_words, real_words)
+              for pos_tag, pos_texts in texts.items()}
+    grid = list(product(texts, real_words, considered_words, (keep_deltas,)))
+    logging.info("Search: Evaluating %s grid points.", len(grid))
+
+    if jobs == 1:
+        _initialize(shared)
+        return [evaluate(*point) for point in grid]
+    with ProcessPoolExecutor(jobs or os.cpu_count(), initializer=_initialize,
+                             initargs=(shared,)) as executor:
+        return list(executor.map(_evaluate, grid))
+
+
+def best(results):
+    """Return the result with the best accuracy (the first one on ties)."""
+    return max(results, key=lambda result: result["accuracy"])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Cross-validated parameter search for Delta.')
+    parser.add_argument('-i',
+                        action='store',
+                        help='Path to input directory (or packed corpus)')
+    parser.add_argument('-o',
+                        action='store',
+                        help='Path to the output file of the report '
+                             '(default: standard output)')
+    parser.add_argument('--considered-words',
+                        action='store',
+                        type=int,
+                        nargs='+',
+                        default=[150, 200, 250, 300],
+                        help='The numbers of considered words')
+    parser.add_argument('--real-words',
+                        action='store',
+                        type=int,
+                        nargs='+',
+                        choices=[0, 1],
+                        default=[1],
+                        help='The real words settings')
+    parser.add_argument('--pos-tag',
+                        action='store',
+                        type=int,
+                        nargs='+',
+                        choices=[0, 1],
+                        default=[0],
+                        help='The POS tagging settings')
+    parser.add_argument('--folds',
+                        action='store',
+                        type=int,
+                        default=0,
+                        help='Number of folds (0 for leave-one-out)')
+    parser.add_argument('--jobs',
+                        action='store',
+                        type=int,
+                        default=1,
+                        help='Number of worker processes (0 for one per CPU)')
+
+    args = vars(parser.parse_args())
+
+    corpus = open_corpus(args['i'])
+    files = [(corpus.training_key(candidate, training),
+              candidate + " " + training)
+             for candidate in corpus.candidates
+             for training in corpus.trainings[candidate]]
+    labels = [candidate for candidate in corpus.candidates
+              for training in corpus.trainings[candidate]]
+    texts = {bool(pos_tag): load_texts(files, pos_tag=bool(pos_tag),
+                                       jobs=args['jobs'], corpus=corpus)
+             for pos_tag in args['pos_tag']}
+
+    results = search(texts, labels,
+                     considered_words=args['considered_words'],
+                     real_words=[bool(real) for real in args['real_words']],
+                     folds=args['folds'], jobs=args['jobs'])
+    report = {"results": results, "best": best(results)}
+    if args['o']:
+        with open(args['o'], "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+
+if __name__ == "__main__":
+    # execute only if run as a script
+    logging.basicConfig(level=logging.ERROR,
+                        format='%(asctime)s %(levelname)s: %(message)s')
+    main()
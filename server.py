@@ -0,0 +1,242 @@
+import argparse
+import asyncio
+import json
+import logging
+from collections import Counter
+
+from burrows02 import Text, vocabulary
+from model import Model
+from tokenizer import get_tokenizer
+
+
+class Server:
+
+    """
+    Attributes texts with a model which is loaded once.
+
+    The texts of concurrent requests are collected and scored together in
+    one batch, i.e. with one delta matrix (see Model.deltas).
+    """
+
+    def __init__(self, model, batch_size=256, batch_delay=0.005):
+        """
+        Initialize a server.
+
+        Keyword arguments:
+        model -- The model.Model used for the attribution.
+        batch_size -- Maximal number of texts scored in one batch.
+                      (default 256)
+        batch_delay -- Seconds to wait for further requests before a batch
+                       is scored. (default 0.005)
+        """
+        self.model = model
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.queue = None
+
+    async def attribute(self, raws, k=None):
+        """
+        Attribute the given raw texts. Returns for every text a list of
+        (author, delta) tuples of the k closest authors (or all authors if
+        k is None).
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((raws, k, future))
+        return await future
+
+    async def score_batches(self):
+        """Collect the queued requests and score them batch by batch."""
+        loop = asyncio.get_running_loop()
+        while True:
+            requests = [await self.queue.get()]
+            size = len(requests[0][0])
+            await asyncio.sleep(self.batch_delay)
+            while not self.queue.empty() and size < self.batch_size:
+                request = self.queue.get_nowait()
+                requests.append(request)
+                size += len(request[0])
+
+            texts = [raw for request in requests for raw in request[0]]
+            # The largest k of the batch (None ranks all authors), such
+            # that an index of the model can skip the other authors.
+            ks = [request[1] for request in requests]
+            k = None if None in ks else max(ks)
+            logging.info("Server: Scoring %s texts of %s requests.",
+                         len(texts), len(requests))
+            try:
+                results = await loop.run_in_executor(None, self.score, texts,
+                                                     k)
+            except Exception as e:
+                for raws, k, future in requests:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            start = 0
+            for raws, k, future in requests:
+                if not future.done():
+                    try:
+                        future.set_result([ranking[:k] for ranking in
+                                           results[start:start + len(raws)]])
+                    except Exception as e:
+                        future.set_exception(e)
+                start += len(raws)
+
+    def score(self, raws, k=None):
+        """
+        Process the given raw texts and return their k closest authors
+        (all authors if k is None, see Model.attribute). Only the words of the model
+        are counted, such that the words of the requests are not added to
+        the vocabulary of the process, which would grow with every request
+        otherwise. The sums of the texts still include all words.
+        """
+        tokenizer = get_tokenizer(self.model.pos_tag)
+        texts = []
+        for i, tokens in enumerate(tokenizer.tokenize_batch(raws)):
+            counter = Counter(tokens)
+            text = Text(None, str(i), process=False)
+            text.count({word: count for word, count in counter.items()
+                        if vocabulary.ids.get(word) in self.model.columns})
+            text.sum = sum(counter.values())
+            texts.append(text)
+        return self.model.attribute(texts, k=k)
+
+    async def handle(self, reader, writer):
+        """
+        Handle a HTTP connection. A request is a POST of a JSON object of
+        the form {"texts": ["...", ...], "k": 3} ("k" is optional) and the
+        response is a JSON object of the form
+        {"results": [[{"author": "...", "delta": 1.23}, ...], ...]}.
+        """
+        try:
+            while True:
+                request = await reader.readline()
+                if not request:
+                    break
+                method, target, version = request.decode("latin-1").split()
+                headers = {}
+                while True:
+                    line = (await reader.readline()).decode("latin-1").strip()
+                    if not line:
+                        break
+                    name, value = line.split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(
+                    int(headers.get("content-length", 0)))
+
+                if method == "GET" and target == "/health":
+                    status, response = 200, {"authors": len(self.model.authors)}
+                elif method == "POST":
+                    try:
+                        texts, k = parse_query(
+                            json.loads(body.decode("utf-8")))
+                        rankings = await self.attribute(texts, k)
+                        status, response = 200, {"results": [
+                            [{"author": author, "delta": delta}
+                             for author, delta in ranking]
+                            for ranking in rankings]}
+                    except (ValueError, KeyError, TypeError) as e:
+                        status, response = 400, {"error": str(e)}
+                    except Exception as e:
+                        logging.exception("Server: Failed to attribute "
+                                          "texts.")
+                        status, response = 500, {"error": repr(e)}
+                else:
+                    status, response = 404, {"error": "not found"}
+
+                data = json.dumps(response).encode("utf-8")
+                writer.write(("HTTP/1.1 %d %s\r\n"
+                              "Content-Type: application/json\r\n"
+                              "Content-Length: %d\r\n\r\n"
+                              % (status, "OK" if status == 200 else "Error",
+                                 len(data))).encode("latin-1") + data)
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8000, socket=None):
+        """
+        Serve on the given host and port or, if socket is given,
+        on the Unix socket with this path.
+        """
+        self.queue = asyncio.Queue()
+        batches = asyncio.create_task(self.score_batches())
+        if socket is not None:
+            server = await asyncio.start_unix_server(self.handle, path=socket)
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+        logging.info("Server: Listening on %s.",
+                     socket or "%s:%s" % (host, port))
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batches.cancel()
+
+
+def parse_query(query):
+    """
+    Return the texts and k of a request (see Server.handle). Raises a
+    ValueError if the request is malformed.
+    """
+    if not isinstance(query, dict):
+        raise ValueError("The request has to be a JSON object.")
+    texts = query.get("texts")
+    if not isinstance(texts, list) or \
+            not all(isinstance(text, str) for text in texts):
+        raise ValueError("'texts' has to be a list of strings.")
+    k = query.get("k")
+    if k is not None and (not isinstance(k, int) or isinstance(k, bool)
+                          or k < 0):
+        raise ValueError("'k' has to be a non-negative integer.")
+    return texts, k
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Attribution server for Delta.')
+    parser.add_argument('-m',
+                        action='store',
+                        required=True,
+                        help='Path to a trained model '
+                             '(see burrows02.py --save-model)')
+    parser.add_argument('--host',
+                        action='store',
+                        default='127.0.0.1',
+                        help='Host to listen on')
+    parser.add_argument('--port',
+                        action='store',
+                        type=int,
+                        default=8000,
+                        help='Port to listen on')
+    parser.add_argument('--socket',
+                        action='store',
+                        help='Path of a Unix socket to listen on instead')
+    parser.add_argument('--batch-size',
+                        action='store',
+                        type=int,
+                        default=256,
+                        help='Maximal number of texts scored in one batch')
+    parser.add_argument('--index',
+                        action='store_true',
+                        help='Build an index of the authors for requests with '
+                             'k (pays off from about 20000 authors)')
+
+    args = vars(parser.parse_args())
+
+    model = Model.load(args['m'])
+    if args['index']:
+        model.build_index()
+    server = Server(model, batch_size=args['batch_size'])
+    asyncio.run(server.serve(args['host'], args['port'], args['socket']))
+
+
+if __name__ == "__main__":
+    # execute only if run as a script
+    logging.basicConfig(level=logging.ERROR,
+                        format='%(asctime)s %(levelname)s: %(message)s')
+    main()
@@ -0,0 +1,293 @@
+import argparse
+import json
+import logging
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import numpy as np
+
+import jsonhandler
+from burrows02 import (Author, Database, Text, WordStatistics, delta_matrix,
+                       load_texts, rank_candidates, zscore_matrix)
+from corpus import open_corpus
+from model import Model
+
+
+# The steps of a sharded run. Every step reads the results of the previous
+# steps from the exchange directory and writes its own results to it.
+STEPS = ("count", "merge", "score", "reduce")
+
+
+def shard_of(items, shard, shards):
+    """Return the items of a shard (every shards-th item from shard on)."""
+    return items[shard::shards]
+
+
+def write_json(path, data):
+    """
+    Write JSON to a file atomically, such that other processes (or nodes)
+    never read a partially written file.
+    """
+    temporary = path + ".tmp"
+    with open(temporary, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(temporary, path)
+
+
+def save_array(path, array):
+    """Save a NumPy array to a .npy file atomically (see write_json)."""
+    temporary = path + ".tmp"
+    # np.save appends .npy to a path, but not to an open file.
+    with open(temporary, "wb") as f:
+        np.save(f, array)
+    os.replace(temporary, path)
+
+
+def read_json(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def shard_path(exchange, name, shard, shards):
+    return os.path.join(exchange, "%s-%d-of-%d.json" % (name, shard, shards))
+
+
+def count(corpusdir, exchange, shard, shards, pos_tag=False, cache=None):
+    """
+    Count a shard of a corpus: the statistics of the training texts of
+    every shards-th candidate author (see WordStatistics) and the counters
+    of every shards-th unknown text. Writes them to the exchange directory.
+    """
+    corpus = open_corpus(corpusdir)
+    authors = {}
+    for candidate in shard_of(corpus.candidates, shard, shards):
+        files = [(corpus.training_key(candidate, training),
+                  candidate + " " + training)
+                 for training in corpus.trainings[candidate]]
+        statistics = WordStatistics()
+        for text in load_texts(files, pos_tag=pos_tag, cache=cache,
+                               corpus=corpus):
+            statistics.add(text)
+        authors[candidate] = statistics.to_dict()
+
+    unknowns = shard_of(corpus.unknowns, shard, shards)
+    files = [(corpus.unknown_key(unknown), unknown) for unknown in unknowns]
+    counters = {text.name: list(text.counter.items())
+                for text in load_texts(files, pos_tag=pos_tag, cache=cache,
+                                       corpus=corpus)}
+    write_json(shard_path(exchange, "count", shard, shards),
+               {"authors": authors, "unknowns": counters})
+    logging.info("Sharding: Counted shard %s of %s.", shard, shards)
+
+
+def merge(corpusdir, exchange, shards, considered_words=150, pos_tag=False):
+    """
+    Merge the counts of all shards (see count) into the statistics of the
+    whole corpus. Writes the model of all authors (see model.Model) and the
+    zscore matrix and mask of all unknown texts to the exchange directory.
+
+    The statistics of every author are merged in the order of the shards
+    and the authors are added to the database in the order of the corpus,
+    so the counts and the ranking of the words are exactly those of a
+    database of all texts. If every author is counted in one shard (see
+    count), the same holds for the sums of the frequencies and thus for
+    the zscores.
+    """
+    corpus = open_corpus(corpusdir)
+    statistics = {}
+    counters = {}
+    for shard in range(shards):
+        data = read_json(shard_path(exchange, "count", shard, shards))
+        for candidate, partial in data["authors"].items():
+            partial = WordStatistics.from_dict(partial)
+            if candidate in statistics:
+                statistics[candidate].merge(partial)
+            else:
+                statistics[candidate] = partial
+        counters.update(data["unknowns"])
+
+    database = Database(considered_words, real_words=True, vectorized=True)
+    for candidate in corpus.candidates:
+        database.add_author(Author.from_statistics(candidate,
+                                                   statistics[candidate]))
+    database.process()
+    database.calc_zscores()
+    model = Model.from_database(database, pos_tag=pos_tag)
+    model.save(os.path.join(exchange, "model.bin"))
+
+    texts = []
+    for unknown in corpus.unknowns:
+        text = Text(None, unknown, process=False)
+        text.count({tuple(token) if isinstance(token, list) else token: n
+                    for token, n in counters[unknown]})
+        texts.append(text)
+    zscores, mask = zscore_matrix(texts, model.columns, model.mean,
+                                  model.stdev)
+    save_array(os.path.join(exchange, "zscores.npy"), zscores)
+    save_array(os.path.join(exchange, "mask.npy"), mask)
+    logging.info("Sharding: Merged %s shards of %s authors.", shards,
+                 len(database.authors))
+
+
+def score(exchange, shard, shards, k=1):
+    """
+    Score all unknown texts against a shard of the authors (every
+    shards-th author of the model) and write the k closest authors of
+    the shard for every text (as rows of the model) and their deltas to
+    the exchange directory. The model and the zscores are memory-mapped,
+    so only the zscores of the authors of the shard are read.
+    """
+    model = Model.load(os.path.join(exchange, "model.bin"))
+    zscores = np.load(os.path.join(exchange, "zscores.npy"), mmap_mode="r")
+    mask = np.load(os.path.join(exchange, "mask.npy"), mmap_mode="r")
+    rows = np.arange(shard, len(model.authors), shards)
+    deltas = delta_matrix(np.asarray(zscores), np.asarray(model.zscores[rows]),
+                          np.asarray(mask))
+    ranking = rank_candidates(deltas, k)
+    write_json(shard_path(exchange, "score", shard, shards), {
+        "rows": rows[ranking].tolist(),
+        "deltas": np.take_along_axis(deltas, ranking, axis=1).tolist(),
+    })
+    logging.info("Sharding: Scored shard %s of %s.", shard, shards)
+
+
+def reduce(corpusdir, exchange, outputdir, shards, k=1):
+    """
+    Merge the k closest authors of all shards (see score) into the k
+    closest authors of every unknown text and write the answers (see
+    jsonhandler.storeJson). Ties are broken by the order of the authors,
+    as in burrows02.rank_candidates. If k is larger than 1, the ranked
+    candidates are written with every answer.
+    """
+    corpus = open_corpus(corpusdir)
+    model = Model.load(os.path.join(exchange, "model.bin"))
+    results = [read_json(shard_path(exchange, "score", shard, shards))
+               for shard in range(shards)]
+    if not corpus.unknowns:
+        jsonhandler.storeJson(outputdir, [], [])
+        return
+    rows = np.concatenate([np.array(result["rows"], dtype=np.intp)
+                           .reshape(len(corpus.unknowns), -1)
+                           for result in results], axis=1)
+    deltas = np.concatenate([np.array(result["deltas"], dtype=float)
+                             .reshape(len(corpus.unknowns), -1)
+                             for result in results], axis=1)
+    cands = []
+    candidates = []
+    for text_rows, text_deltas in zip(rows, deltas):
+        order = np.lexsort((text_rows, text_deltas))[:k]
+        cands.append(model.authors[text_rows[order[0]]])
+        candidates.append([{"author": model.authors[row], "delta": float(delta)}
+                           for row, delta in zip(text_rows[order],
+                                                 text_deltas[order])])
+    jsonhandler.storeJson(outputdir, corpus.unknowns, cands,
+                          candidates=candidates if k > 1 else None)
+    logging.info("Sharding: Written the answers of %s texts.", len(cands))
+
+
+def run(corpusdir, outputdir, shards=2, jobs=0, exchange=None,
+        considered_words=150, k=1, pos_tag=False, cache=None):
+    """
+    Run all steps on this machine, the counting and scoring of the shards
+    in a pool of worker processes. The steps exchange their results through
+    the files of the exchange directory, just as they would on several
+    nodes which share it.
+
+    Keyword arguments:
+    corpusdir -- Path to a tira corpus or to a packed corpus.
+    outputdir -- Output directory of the answers.
+    shards -- Number of shards. (default 2)
+    jobs -- Number of worker processes (0 for one per CPU). (default 0)
+    exchange -- The exchange directory. If None then a temporary directory
+                is used. (default None)
+    considered_words -- See Database. (default 150)
+    k -- Number of candidates per text (see reduce). (default 1)
+    pos_tag -- Should the texts be POS tagged? (default False)
+    cache -- A countcache.CountCache shared by the workers. (default None)
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        exchange = exchange or tmp
+        os.makedirs(exchange, exist_ok=True)
+        with ProcessPoolExecutor(jobs or os.cpu_count()) as executor:
+            list(executor.map(count, repeat(corpusdir), repeat(exchange),
+                              range(shards), repeat(shards), repeat(pos_tag),
+                              repeat(cache)))
+            merge(corpusdir, exchange, shards, considered_words, pos_tag)
+            list(executor.map(score, repeat(exchange), range(shards),
+                              repeat(shards), repeat(k)))
+        reduce(corpusdir, exchange, outputdir, shards, k)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Delta with statistics and authors sharded over '
+                    'processes or nodes.')
+    parser.add_argument('-i',
+                        action='store',
+                        required=True,
+                        help='Path to input directory (or packed corpus)')
+    parser.add_argument('-o',
+                        action='store',
+                        help='Path to output directory')
+    parser.add_argument('-x',
+                        action='store',
+                        help='Path to the exchange directory (required for '
+                             'single steps)')
+    parser.add_argument('--step',
+                        action='store',
+                        choices=STEPS,
+                        help='Run only this step (of the given --shard for '
+                             'count and score), e.g. on one node (default: '
+                             'all steps on this machine)')
+    parser.add_argument('--shard',
+                        action='store',
+                        type=int,
+                        default=0,
+                        help='The shard of the step')
+    parser.add_argument('--shards',
+                        action='store',
+                        type=int,
+                        default=2,
+                        help='Number of shards')
+    parser.add_argument('--jobs',
+                        action='store',
+                        type=int,
+                        default=0,
+                        help='Number of worker processes (0 for one per CPU)')
+    parser.add_argument('--considered-words',
+                        action='store',
+                        type=int,
+                        default=150,
+                        help='The number of considered words')
+    parser.add_argument('--top',
+                        action='store',
+                        type=int,
+                        default=1,
+                        help='Number of ranked candidates per unknown text')
+
+    args = vars(parser.parse_args())
+
+    if args['step'] is None:
+        run(args['i'], args['o'], shards=args['shards'], jobs=args['jobs'],
+            exchange=args['x'], considered_words=args['considered_words'],
+            k=args['top'])
+    elif args['x'] is None:
+        parser.error("A single step requires an exchange directory (-x).")
+    elif args['step'] == "count":
+        os.makedirs(args['x'], exist_ok=True)
+        count(args['i'], args['x'], args['shard'], args['shards'])
+    elif args['step'] == "merge":
+        merge(args['i'], args['x'], args['shards'], args['considered_words'])
+    elif args['step'] == "score":
+        score(args['x'], args['shard'], args['shards'], args['top'])
+    else:
+        reduce(args['i'], args['x'], args['o'], args['shards'], args['top'])
+
+
+if __name__ == "__main__":
+    # execute only if run as a script
+    logging.basicConfig(level=logging.ERROR,
+                        format='%(asctime)s %(levelname)s: %(message)s')
+    main()
@@ -0,0 +1,22 @@
+import numpy as np
+import pytest
+
+from authorindex import AuthorIndex, synthetic
+from burrows02 import delta_matrix, rank_candidates
+
+
+AUTHORS = 200
+
+
+@pytest.mark.parametrize("k", [0, 1, AUTHORS, AUTHORS + 5])
+def test_index_matches_rank_candidates(k):
+    author_zscores, text_zscores, mask = synthetic(AUTHORS, 50, 20)
+    index = AuthorIndex(author_zscores, leaf_size=8)
+    rows, deltas = index.query_matrix(text_zscores, mask, k)
+
+    expected_deltas = delta_matrix(text_zscores, author_zscores, mask)
+    expected = rank_candidates(expected_deltas, k)
+    assert rows.shape == expected.shape
+    assert (rows == expected).all()
+    assert np.allclose(deltas, np.take_along_axis(expected_deltas, expected,
+                                                  axis=1))
@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+from calibration import METHODS, Calibration, confidence_bound
+
+
+def synthetic_deltas(texts, authors=10, shift=0.5, seed=0):
+    """
+    Return a synthetic delta matrix, in which the delta of the true author
+    of every text is lowered by shift, and the true authors.
+    """
+    random = np.random.default_rng(seed)
+    labels = random.integers(authors, size=texts)
+    deltas = random.normal(1.0, 0.2, size=(texts, authors))
+    deltas[np.arange(texts), labels] -= shift * random.uniform(0.5, 1, texts)
+    return deltas, labels
+
+
+@pytest.mark.parametrize("method", METHODS)
+def test_mean_top_score_tracks_accuracy(method):
+    deltas, labels = synthetic_deltas(400, seed=1)
+    calibration = Calibration.fit(deltas, labels, method)
+    for seed in (1, 2):
+        deltas, labels = synthetic_deltas(2000, seed=seed)
+        accuracy = (deltas.argmin(axis=1) == labels).mean()
+        assert 0.4 < accuracy < 0.9
+        top_scores = calibration.scores(deltas).max(axis=1)
+        assert abs(top_scores.mean() - accuracy) < 0.1
+
+
+@pytest.mark.parametrize("method", METHODS)
+def test_separable_texts_are_not_certain(method):
+    deltas, labels = synthetic_deltas(24, shift=2.0)
+    assert (deltas.argmin(axis=1) == labels).all()
+    calibration = Calibration.fit(deltas, labels, method)
+    top_scores = calibration.scores(deltas).max(axis=1)
+    assert top_scores.mean() <= confidence_bound(deltas, labels) + 1e-6
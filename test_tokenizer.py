@@ -0,0 +1,75 @@
+import random
+import time
+
+import pytest
+
+from tokenizer import POSTagger, WordTokenizer
+
+
+def reference_tokens(raw):
+    """The tokens of the former per-character implementation."""
+    return [x for x in [''.join(c for c in word if c.isalpha()).lower()
+                        for word in raw.split()]
+            if x != '']
+
+
+def random_text(rng, length):
+    alphabet = ("abcXYZ \u00e4\u00f6\u00fc\u00df\u00c6\u00f8\u00e9\u00f1 "
+                "\u03a3\u03c3\u03c2\u0414\u0436\u5b57 \t\n\u00a0\u2003"
+                ".,;:'\"!?-()\u2019\u201c\u201d\u2014\u2026"
+                "0123456789\u0301\U0001F600")
+    return "".join(rng.choice(alphabet) for i in range(length))
+
+
+def test_word_tokenizer_matches_reference():
+    rng = random.Random(0)
+    tokenizer = WordTokenizer()
+    for i in range(2000):
+        raw = random_text(rng, rng.randint(0, 200))
+        assert tokenizer.tokenize(raw) == reference_tokens(raw), repr(raw)
+
+
+def test_word_tokenizer_is_faster_than_reference():
+    rng = random.Random(1)
+    words = ["the", "of", "and", "Delta", "author's", "text,", "words.",
+             "(style)", "-", '"quoted"', "1878"]
+    raw = " ".join(rng.choice(words) for i in range(200000))
+    tokenizer = WordTokenizer()
+    assert tokenizer.tokenize(raw) == reference_tokens(raw)
+
+    def best_time(function):
+        times = []
+        for i in range(3):
+            start = time.perf_counter()
+            function(raw)
+            times.append(time.perf_counter() - start)
+        return min(times)
+
+    # About ten times faster on English texts; the bound leaves room for
+    # noisy machines.
+    assert best_time(reference_tokens) > 5 * best_time(tokenizer.tokenize)
+
+
+def test_pos_tagger_batch_matches_single_texts(monkeypatch):
+    nltk = pytest.importorskip("nltk")
+    from nltk.tag.perceptron import PerceptronTagger
+    from nltk.tokenize import TreebankWordTokenizer
+
+    # Neither the tokenizer nor the tagger need the NLTK data.
+    monkeypatch.setattr(nltk, "word_tokenize",
+                        TreebankWordTokenizer().tokenize)
+    tagger = PerceptronTagger(load=False)
+    tagger.train([[("The", "DT"), ("author", "NN"), ("writes", "VBZ"),
+                   (".", ".")],
+                  [("A", "DT"), ("text", "NN"), ("is", "VBZ"),
+                   ("short", "JJ"), (".", ".")]], nr_iter=3)
+    tokenizer = POSTagger()
+    tokenizer.tagger = tagger
+
+    rng = random.Random(2)
+    words = ["The", "author", "writes", "a", "short", "text", ".", ",",
+             "Delta", "is"]
+    raws = [" ".join(rng.choice(words) for i in range(rng.randint(0, 50)))
+            for i in range(50)]
+    assert tokenizer.tokenize_batch(raws) == \
+        [tokenizer.tokenize(raw) for raw in raws]
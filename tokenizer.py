@@ -0,0 +1,109 @@
+import re
+
+
+class Tokenizer:
+
+    """
+    Splits raw texts into the tokens which are counted for a text.
+
+    A tokenizer has to implement tokenize. It can override tokenize_batch
+    if it processes several texts faster at once. The name identifies the
+    tokens a tokenizer produces, e.g. in a countcache.CountCache.
+    """
+
+    name = None
+    tagged = False  # are the tokens (word, tag) tuples?
+
+    def tokenize(self, raw):
+        """Return the list of the tokens of a raw text."""
+        raise NotImplementedError
+
+    def tokenize_batch(self, raws):
+        """Return the lists of the tokens of several raw texts."""
+        return [self.tokenize(raw) for raw in raws]
+
+
+class WordTokenizer(Tokenizer):
+
+    """
+    Takes all alphabetic words normalized to lowercase, i.e. every
+    whitespace separated word without its non-alphabetic characters.
+
+    Instead of looking at every character in Python, the non-alphabetic
+    characters are deleted from the whole text at once: the ASCII ones
+    from its UTF-8 encoding with bytes.translate (which can not break
+    multibyte sequences, whose bytes are all non-ASCII) and the few
+    non-ASCII ones with a regular expression of the characters which
+    actually occur in the text.
+    """
+
+    name = "words"
+
+    # ASCII characters which are neither alphabetic nor whitespace.
+    DELETE = bytes(c for c in range(128)
+                   if not chr(c).isalpha() and not chr(c).isspace())
+    NON_ASCII = re.compile(r"[^\x00-\x7f]")
+
+    def tokenize(self, raw):
+        if not raw.isascii():
+            delete = "".join(c for c in set(self.NON_ASCII.findall(raw))
+                             if not c.isalpha() and not c.isspace())
+            if delete:
+                raw = re.sub("[%s]+" % re.escape(delete), "", raw)
+        return raw.encode("utf-8").translate(None, self.DELETE) \
+            .decode("utf-8").lower().split()
+
+
+class POSTagger(Tokenizer):
+
+    """
+    Tokenizes texts with NLTK and tags them with its perceptron tagger.
+    The tokens are (word, tag) tuples. A list of all tags can be seen with
+    nltk.help.upenn_tagset().
+
+    The tagger is loaded once and reused for all texts (nltk.pos_tag loads
+    it again for every call). Requires NLTK and its punkt and
+    averaged_perceptron_tagger data.
+    """
+
+    name = "pos"
+    tagged = True
+
+    def __init__(self):
+        self.tagger = None
+
+    def __getstate__(self):
+        # The tagger is loaded again in other processes.
+        return {"tagger": None}
+
+    def load(self):
+        """Return the tagger, which is loaded on first use."""
+        if self.tagger is None:
+            from nltk.tag.perceptron import PerceptronTagger
+            self.tagger = PerceptronTagger()
+        return self.tagger
+
+    def tokenize(self, raw):
+        import nltk
+        return self.load().tag(nltk.word_tokenize(raw))
+
+    def tokenize_batch(self, raws):
+        # Every text is tagged as one sequence, as in tokenize, but the
+        # tagger gets all texts of the batch at once (tag_sents).
+        import nltk
+        return self.load().tag_sents([nltk.word_tokenize(raw)
+                                      for raw in raws])
+
+
+# The default tokenizers for the pos_tag settings.
+tokenizers = {False: WordTokenizer(), True: POSTagger()}
+
+
+def get_tokenizer(pos_tag=True, tokenizer=None):
+    """
+    Return the given tokenizer or, if it is None, the default tokenizer
+    for the pos_tag setting.
+    """
+    if tokenizer is not None:
+        return tokenizer
+    return tokenizers[bool(pos_tag)]
@@ -0,0 +1,40 @@
+class Vocabulary:
+
+    """
+    Interns words (or (word, tag) tuples), i.e. maps every word to an
+    integer ID, such that texts and authors can store their words as
+    arrays of IDs instead of dictionaries of strings.
+    """
+
+    __slots__ = ("ids", "words")
+
+    def __init__(self):
+        self.ids = {}     # maps every word to its ID
+        self.words = []   # maps every ID to its word
+
+    def __len__(self):
+        return len(self.words)
+
+    def clear(self):
+        """
+        Forget all words. The IDs of texts and authors which have been
+        created before are invalid afterwards.
+        """
+        self.ids.clear()
+        self.words.clear()
+
+    def id(self, word):
+        """Return the ID of a word. A new word gets the next free ID."""
+        i = self.ids.get(word)
+        if i is None:
+            i = self.ids[word] = len(self.words)
+            self.words.append(word)
+        return i
+
+
+# The vocabulary shared by all texts and authors of this process.
+# It lives in its own module such that it is the same object even if
+# burrows02 is executed as a script and imported by other modules.
+# (Worker processes only send counters of words, see
+# burrows02.load_texts.)
+vocabulary = Vocabulary()